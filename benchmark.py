@@ -0,0 +1,669 @@
+import json
+import multiprocessing
+import platform
+import random
+import statistics
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import spacy
+import typer
+
+import extraction
+import instrumentation
+import model
+import prompt
+import skill_scraper
+import synthetic
+import workers
+
+ENV_RESOURCES = synthetic.ENV_RESOURCES
+
+app = typer.Typer()
+
+
+def time_function(func, repeats: int = 5, items: int = None) -> dict:
+    """
+    run a function several times and summarize how long it took
+
+    :param func: the function to time; called without arguments
+    :param repeats: how many times to run the function
+    :param items: number of items the function processes per call, used to report throughput
+    :return: the median and minimum run time, and the throughput if items is given
+    """
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    result = {
+        "repeats": repeats,
+        "median_seconds": statistics.median(timings),
+        "min_seconds": min(timings),
+    }
+    if items:
+        result["items_per_second"] = items / result["median_seconds"]
+
+    return result
+
+
+def benchmark_batching(iterations: int, batch_tokens: int, seed: int) -> dict:
+    """
+    train the SKILL entity recognizer once with the compounding minibatches and once with
+    length bucketed minibatches, then compare the training throughput and the F1 on the
+    held out data
+
+    :param iterations: number of training iterations for each run
+    :param batch_tokens: token budget of a batch for the bucketed run
+    :param seed: random seed so both runs see the same data
+    :return: the throughput and scores of each batching strategy
+    """
+    results = {}
+    for strategy, strategy_batch_tokens in (
+        ("compounding", None),
+        ("bucketed", batch_tokens),
+    ):
+        random.seed(seed)
+        nlp = model.NLP()
+        testing_data, training_data = model.build_data_sets(
+            nlp,
+            ENV_RESOURCES + "scraped_skills.txt",
+            ENV_RESOURCES + "skill_sentence_templates.txt",
+            ENV_RESOURCES + "teddy_roosevelt_autobiography.txt",
+        )
+
+        training_stats = nlp.update_entity_recognition(
+            training_data, iterations=iterations, batch_tokens=strategy_batch_tokens
+        )
+        scores = nlp.evaluate(testing_data)
+
+        results[strategy] = {
+            "examples_per_second": training_stats["examples_per_second"],
+            "ents_f": scores["ents_f"],
+            "skill_f": scores["ents_per_type"].get("SKILL", {}).get("f"),
+        }
+
+    return results
+
+
+def benchmark_suite(seed: int, num_resumes: int, repeats: int) -> dict:
+    """
+    time the hot paths of the pipeline end to end. the inputs only come from the resource
+    files and fixed seeds, so runs on the same machine are comparable
+
+    :param seed: random seed for every benchmark
+    :param num_resumes: number of synthetic resumes used for the batch throughput benchmark
+    :param repeats: how many times to run each (non-training) benchmark
+    :return: the timings of each benchmark
+    """
+    results = {}
+    rng = random.Random(seed)
+
+    skill_txt_path = ENV_RESOURCES + "scraped_skills.txt"
+    skill_jsonl_path = ENV_RESOURCES + "jz_skill_patterns.jsonl"
+    skill_file = model.SkillFile(skill_txt_path)
+    skill_list = sorted(skill_file.skills_list)
+
+    results["parse_skills_txt"] = time_function(
+        skill_file.parse_skills, repeats, items=len(skill_list)
+    )
+    results["parse_skills_jsonl"] = time_function(
+        model.SkillFile(skill_jsonl_path).parse_skills, repeats
+    )
+
+    sentence_templates = model.SentenceTemplate(
+        ENV_RESOURCES + "skill_sentence_templates.txt"
+    )
+    results["test_train_split"] = time_function(
+        lambda: sentence_templates.test_train_split(list(skill_list), seed=seed),
+        repeats,
+        items=len(skill_list),
+    )
+
+    nlp = model.NLP()
+
+    revision_data = model.RevisionData(
+        ENV_RESOURCES + "teddy_roosevelt_autobiography.txt"
+    )
+    revision_data.import_text()
+    revision_text = revision_data.text[:200000]
+
+    results["get_sentences"] = time_function(
+        lambda: nlp.get_sentences(revision_text), repeats, items=len(revision_text)
+    )
+    revision_sentences = nlp.get_sentences(revision_text)
+    results["filter_sentences"] = time_function(
+        lambda: nlp.filter_sentences(revision_sentences),
+        repeats,
+        items=len(revision_sentences),
+    )
+    revision_sentences_trimmed = nlp.filter_sentences(revision_sentences)
+    results["predict_entities"] = time_function(
+        lambda: nlp.predict_entities(revision_sentences_trimmed),
+        repeats,
+        items=len(revision_sentences_trimmed),
+    )
+
+    resumes = [
+        synthetic.synthetic_resume(rng, skill_list, sentence_templates)
+        for _ in range(num_resumes)
+    ]
+    results["single_resume_extraction"] = time_function(
+        lambda: extraction.extract_entities(nlp.nlp, resumes[0]), repeats
+    )
+    results["batch_extraction"] = time_function(
+        lambda: list(nlp.nlp.pipe(resumes, batch_size=16)),
+        repeats,
+        items=len(resumes),
+    )
+
+    # training changes the model, so it goes last
+    random.seed(seed)
+    revision_data.revisions = nlp.predict_entities(revision_sentences_trimmed)
+    _, train_revision_data = revision_data.test_train_split()
+    _, train_skill_data = sentence_templates.test_train_split(
+        list(skill_list), seed=seed
+    )
+    training_data = [
+        sentence for value in train_skill_data.values() for sentence in value
+    ] + train_revision_data
+    results["training_epoch"] = time_function(
+        lambda: nlp.update_entity_recognition(training_data, iterations=1),
+        repeats=1,
+        items=len(training_data),
+    )
+
+    return results
+
+
+def benchmark_tier(tier: str, seed: int, iterations: int, num_resumes: int) -> dict:
+    """
+    measure the load time, memory, speed and accuracy of a SKILL model trained on top of
+    one base pipeline. meant to run in a fresh process so the memory numbers only cover
+    this tier
+
+    :param tier: a tier from model.MODEL_TIERS or any base pipeline accepted by model.NLP
+    :param seed: random seed for the training data and synthetic resumes
+    :param iterations: number of training iterations
+    :param num_resumes: number of synthetic resumes to measure the speed on
+    :return: the measurements of the tier
+    """
+    rss_before_load = instrumentation.peak_rss_bytes()
+    load_start = time.perf_counter()
+    nlp = model.NLP(tier)
+    load_seconds = time.perf_counter() - load_start
+    rss_after_load = instrumentation.peak_rss_bytes()
+
+    random.seed(seed)
+    testing_data, training_data = model.build_data_sets(
+        nlp,
+        ENV_RESOURCES + "scraped_skills.txt",
+        ENV_RESOURCES + "skill_sentence_templates.txt",
+        ENV_RESOURCES + "teddy_roosevelt_autobiography.txt",
+    )
+    nlp.update_entity_recognition(training_data, iterations=iterations)
+    scores = nlp.evaluate(testing_data)
+
+    rng = random.Random(seed)
+    sentence_templates = model.SentenceTemplate(
+        ENV_RESOURCES + "skill_sentence_templates.txt"
+    )
+    skill_list = sorted(
+        model.SkillFile(ENV_RESOURCES + "scraped_skills.txt").skills_list
+    )
+    resumes = [
+        synthetic.synthetic_resume(rng, skill_list, sentence_templates)
+        for _ in range(num_resumes)
+    ]
+    speed = time_function(
+        lambda: list(nlp.nlp.pipe(resumes, batch_size=16)), repeats=3, items=num_resumes
+    )
+
+    return {
+        "base_model": nlp.base_model,
+        "load_seconds": load_seconds,
+        "load_rss_bytes": rss_after_load - rss_before_load,
+        "peak_rss_bytes": instrumentation.peak_rss_bytes(),
+        "docs_per_second": speed["items_per_second"],
+        "ents_f": scores["ents_f"],
+        "skill_f": scores["ents_per_type"].get("SKILL", {}).get("f"),
+    }
+
+
+def write_tier_report(results: dict, file_path: str):
+    """
+    write the tier measurements as a markdown table
+
+    :param results: the measurements of each tier
+    :param file_path: the file to write the report to
+    """
+    lines = [
+        "| tier | base pipeline | load (s) | load RSS (MB) | peak RSS (MB) | docs/s | F1 | SKILL F1 |",
+        "|---|---|---|---|---|---|---|---|",
+    ]
+    for tier, result in results.items():
+        skill_f = result["skill_f"] if result["skill_f"] is not None else float("nan")
+        lines.append(
+            f"| {tier} | {result['base_model']} | {result['load_seconds']:.2f} "
+            f"| {result['load_rss_bytes'] / 2 ** 20:.0f} | {result['peak_rss_bytes'] / 2 ** 20:.0f} "
+            f"| {result['docs_per_second']:.1f} | {result['ents_f']:.3f} | {skill_f:.3f} |"
+        )
+
+    with open(file_path, "w") as outfile:
+        outfile.write("\n".join(lines) + "\n")
+
+
+def measure_pipeline(model_path: str, resumes: list) -> dict:
+    """
+    load a pipeline and measure its load time, memory and per-resume extraction latency.
+    meant to run in a fresh process so the memory numbers only cover this pipeline
+
+    :param model_path: anything accepted by model.NLP
+    :param resumes: the resumes to extract entities from
+    :return: the measurements and the entities found in each resume
+    """
+    rss_before_load = instrumentation.peak_rss_bytes()
+    load_start = time.perf_counter()
+    nlp = model.NLP(model_path)
+    load_seconds = time.perf_counter() - load_start
+    rss_after_load = instrumentation.peak_rss_bytes()
+
+    latencies = []
+    entities = []
+    for resume in resumes:
+        start = time.perf_counter()
+        resume_entities = extraction.extract_entities(nlp.nlp, resume, unique=False)
+        latencies.append(time.perf_counter() - start)
+        entities.append([list(entity) for entity in resume_entities])
+
+    return {
+        "pipe_names": nlp.nlp.pipe_names,
+        "load_seconds": load_seconds,
+        "load_rss_bytes": rss_after_load - rss_before_load,
+        "median_latency_seconds": statistics.median(latencies),
+        "entities": entities,
+    }
+
+
+def measure_workers(
+    model_path: str,
+    resumes: list,
+    num_workers: int,
+    start_method: str,
+    vectors_path: str = None,
+) -> dict:
+    """
+    run the resumes through an ExtractionWorkerPool and measure the memory of its workers.
+    meant to run in a fresh process, so the fork start method only shares what this
+    configuration loaded
+
+    :param model_path: the pipeline the workers extract with
+    :param resumes: the resumes to extract entities from
+    :param num_workers: number of worker processes
+    :param start_method: multiprocessing start method of the pool
+    :param vectors_path: if given, the workers memory map the vector table from this file
+    :return: the extraction time and the rss, shared and private memory of every worker
+    """
+    with workers.ExtractionWorkerPool(
+        model_path, num_workers, vectors_path, start_method
+    ) as pool:
+        start = time.perf_counter()
+        pool.extract(resumes)
+        extraction_seconds = time.perf_counter() - start
+        worker_memory = pool.memory_usage()
+
+    return {
+        "extraction_seconds": extraction_seconds,
+        "workers": list(worker_memory.values()),
+    }
+
+
+def compare_results(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    compare benchmark results against a baseline run
+
+    :param results: the benchmark results of this run
+    :param baseline: the benchmark results of the baseline run
+    :param tolerance: allowed relative slow down of the median time before a benchmark
+        counts as a regression
+    :return: the names of the benchmarks that regressed
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+
+        ratio = result["median_seconds"] / baseline[name]["median_seconds"]
+        print(f"{name}: {ratio:.2f}x baseline median time")
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+
+    return regressions
+
+
+@app.command()
+def batching(
+    iterations: int = typer.Option(10, help="number of training iterations per run"),
+    batch_tokens: int = typer.Option(
+        1000, help="token budget of a batch when using length bucketed batching"
+    ),
+    seed: int = typer.Option(0, help="random seed used for every run"),
+    output: str = typer.Option(
+        "", help="path to write the benchmark results to as JSON"
+    ),
+):
+    """
+    compare compounding and length bucketed batching during training
+    """
+    results = benchmark_batching(iterations, batch_tokens, seed)
+
+    for strategy, result in results.items():
+        print(
+            f"{strategy}: {result['examples_per_second']:.1f} examples/s, "
+            f"F1 {result['ents_f']:.3f} (SKILL F1 {result['skill_f']})"
+        )
+
+    if output:
+        with open(output, "w") as outfile:
+            json.dump(results, outfile, indent=2)
+
+
+@app.command()
+def suite(
+    seed: int = typer.Option(0, help="random seed used for every benchmark"),
+    num_resumes: int = typer.Option(
+        64, help="number of synthetic resumes for the batch throughput benchmark"
+    ),
+    repeats: int = typer.Option(5, help="number of runs of each benchmark"),
+    output: str = typer.Option(
+        "benchmark_results.json", help="path to write the benchmark results to as JSON"
+    ),
+    baseline: str = typer.Option(
+        "", help="path to the JSON results of a previous run to compare against"
+    ),
+    tolerance: float = typer.Option(
+        0.1, help="allowed relative slow down against the baseline"
+    ),
+):
+    """
+    time the pipeline's hot paths and optionally check them against a baseline run
+    """
+    results = benchmark_suite(seed, num_resumes, repeats)
+
+    with open(output, "w") as outfile:
+        json.dump(
+            {
+                "metadata": {
+                    "seed": seed,
+                    "num_resumes": num_resumes,
+                    "repeats": repeats,
+                    "python": platform.python_version(),
+                    "spacy": spacy.__version__,
+                    "machine": platform.machine(),
+                    "timestamp": time.time(),
+                },
+                "results": results,
+            },
+            outfile,
+            indent=2,
+        )
+
+    for name, result in results.items():
+        print(f"{name}: {result['median_seconds']:.4f}s median")
+
+    if baseline:
+        with open(baseline, "r") as infile:
+            baseline_results = json.load(infile)["results"]
+        regressions = compare_results(results, baseline_results, tolerance)
+        if regressions:
+            print(f"Regressions against {baseline}: {', '.join(regressions)}")
+            raise typer.Exit(code=1)
+
+
+@app.command()
+def tiers(
+    tier: list[str] = typer.Option(
+        ["sm", "md", "lg"],
+        help="base pipelines to compare. repeat the flag for each tier",
+    ),
+    seed: int = typer.Option(0, help="random seed used for every tier"),
+    iterations: int = typer.Option(10, help="number of training iterations per tier"),
+    num_resumes: int = typer.Option(
+        64, help="number of synthetic resumes to measure the speed on"
+    ),
+    output: str = typer.Option(
+        "model_tiers", help="path prefix of the JSON and markdown reports"
+    ),
+):
+    """
+    train the SKILL entity recognizer on top of each base pipeline and report load time,
+    memory, docs per second and F1 for each
+    """
+    results = {}
+    # each tier is measured in its own process so the memory numbers don't add up
+    context = multiprocessing.get_context("spawn")
+    for tier_name in tier:
+        with context.Pool(1) as pool:
+            results[tier_name] = pool.apply(
+                benchmark_tier, (tier_name, seed, iterations, num_resumes)
+            )
+
+    with open(f"{output}.json", "w") as outfile:
+        json.dump(results, outfile, indent=2)
+    write_tier_report(results, f"{output}.md")
+
+    with open(f"{output}.md", "r") as infile:
+        print(infile.read())
+
+
+@app.command()
+def serving(
+    model_path: str = typer.Argument(
+        ..., help="trained pipeline (or base tier) to compare with its serving pipeline"
+    ),
+    seed: int = typer.Option(0, help="random seed for the synthetic resumes"),
+    num_resumes: int = typer.Option(
+        32, help="number of synthetic resumes to compare the entities of"
+    ),
+    keep_matcher: bool = typer.Option(
+        False, help="keep rule based matchers in the serving pipeline"
+    ),
+):
+    """
+    check that the pruned serving pipeline finds exactly the same entities as the full
+    pipeline, and report how much faster and smaller it is. exits with an error if the
+    entities differ
+    """
+    rng = random.Random(seed)
+    sentence_templates = model.SentenceTemplate(
+        ENV_RESOURCES + "skill_sentence_templates.txt"
+    )
+    skill_list = sorted(
+        model.SkillFile(ENV_RESOURCES + "scraped_skills.txt").skills_list
+    )
+    resumes = [
+        synthetic.synthetic_resume(rng, skill_list, sentence_templates)
+        for _ in range(num_resumes)
+    ]
+
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as serving_model_path:
+        model.NLP(model_path).save_serving_pipeline(serving_model_path, keep_matcher)
+
+        results = {}
+        for name, path in (("full", model_path), ("serving", serving_model_path)):
+            with context.Pool(1) as pool:
+                results[name] = pool.apply(measure_pipeline, (path, resumes))
+
+    for name, result in results.items():
+        print(
+            f"{name} ({', '.join(result['pipe_names'])}): load {result['load_seconds']:.2f}s, "
+            f"load RSS {result['load_rss_bytes'] / 2 ** 20:.0f}MB, "
+            f"{result['median_latency_seconds'] * 1000:.1f}ms median per resume"
+        )
+
+    mismatches = [
+        resume_idx
+        for resume_idx, (full_entities, serving_entities) in enumerate(
+            zip(results["full"]["entities"], results["serving"]["entities"])
+        )
+        if full_entities != serving_entities
+    ]
+    if mismatches:
+        print(f"Entities differ for synthetic resumes {mismatches}")
+        raise typer.Exit(code=1)
+
+    print(f"Entities match for all {num_resumes} synthetic resumes")
+
+
+@app.command()
+def prompts(
+    num_resumes: int = typer.Option(1000, help="number of synthetic resumes"),
+    num_jobs: int = typer.Option(100, help="number of synthetic (company, role) jobs"),
+    repeats: int = typer.Option(3, help="number of times to render the prompts"),
+    seed: int = typer.Option(0, help="random seed for the skills and the prompts"),
+):
+    """
+    time rendering a prompt for every combination of synthetic resume and job
+    """
+    rng = random.Random(seed)
+    skill_list = sorted(
+        model.SkillFile(ENV_RESOURCES + "scraped_skills.txt").skills_list
+    )
+    resumes = [
+        (f"Person {resume_idx}", rng.sample(skill_list, k=rng.randint(5, 40)))
+        for resume_idx in range(num_resumes)
+    ]
+    jobs = [
+        (f"Company {job_idx}", f"Role {job_idx}", rng.sample(skill_list, k=3), "")
+        for job_idx in range(num_jobs)
+    ]
+
+    result = time_function(
+        lambda: sum(
+            1 for _ in prompt.PromptEngine(seed=seed).render_batch(resumes, jobs)
+        ),
+        repeats,
+        items=num_resumes * num_jobs,
+    )
+    print(
+        f"{num_resumes * num_jobs} prompts: {result['median_seconds']:.2f}s median, "
+        f"{result['items_per_second']:.0f} prompts per second"
+    )
+
+
+@app.command(name="workers")
+def worker_memory(
+    model_path: str = typer.Argument(
+        ..., help="trained pipeline (or base tier) the workers extract with"
+    ),
+    num_workers: int = typer.Option(4, help="number of worker processes"),
+    num_resumes: int = typer.Option(64, help="number of synthetic resumes to extract"),
+    vectors_path: str = typer.Option(
+        "",
+        help=".npy file to memory map the vector table from. written on first use",
+    ),
+    seed: int = typer.Option(0, help="random seed for the synthetic resumes"),
+):
+    """
+    compare the per worker shared and private memory of an extraction worker pool that
+    forks from a parent with the model loaded against one whose workers each load the
+    model (with memory mapped vectors if --vectors-path is given). only available on Linux
+    """
+    rng = random.Random(seed)
+    sentence_templates = model.SentenceTemplate(
+        ENV_RESOURCES + "skill_sentence_templates.txt"
+    )
+    skill_list = sorted(
+        model.SkillFile(ENV_RESOURCES + "scraped_skills.txt").skills_list
+    )
+    resumes = [
+        synthetic.synthetic_resume(rng, skill_list, sentence_templates)
+        for _ in range(num_resumes)
+    ]
+
+    # the pool's workers are children of the measuring process, which rules out a
+    # multiprocessing.Pool (its processes are daemons and can't have children)
+    context = multiprocessing.get_context("spawn")
+    for start_method in ("fork", "spawn"):
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            result = executor.submit(
+                measure_workers,
+                model_path,
+                resumes,
+                num_workers,
+                start_method,
+                vectors_path or None,
+            ).result()
+
+        print(
+            f"{start_method}: {num_resumes} resumes in {result['extraction_seconds']:.2f}s"
+        )
+        for worker_idx, memory in enumerate(result["workers"]):
+            print(
+                f"  worker {worker_idx}: RSS {memory['rss'] / 2 ** 20:.0f}MB, "
+                f"shared {memory['shared'] / 2 ** 20:.0f}MB, "
+                f"private {memory['private'] / 2 ** 20:.0f}MB"
+            )
+
+
+@app.command()
+def browser(
+    url: list[str] = typer.Option(
+        [
+            "https://www.google.com/search?q=site%3Alinkedin.com%2Fin%2F+%22data+science%22",
+            "https://www.linkedin.com/",
+        ],
+        help="pages to load. prepend each with --url",
+    ),
+    browser_profile: list[str] = typer.Option(
+        list(skill_scraper.BROWSER_PROFILES),
+        help="skill scraper browser profiles to compare. prepend each with --browser_profile",
+    ),
+    repeats: int = typer.Option(3, help="number of times to load each page"),
+    output: str = typer.Option(
+        "browser_benchmark.json", help="where to write the page load measurements"
+    ),
+):
+    """
+    compare the page load time and bytes transferred of the skill scraper's browser profiles.
+    every profile starts from an empty Chrome user data directory, so the first load of each
+    page is a cold cache load
+    """
+    results = {}
+    for profile_name in browser_profile:
+        with tempfile.TemporaryDirectory() as profile_dir:
+            driver = skill_scraper.initialize_web_scraper(
+                profile_dir=profile_dir,
+                log_network=True,
+                **skill_scraper.browser_profile_options(profile_name),
+            )
+            try:
+                results[profile_name] = {
+                    page_url: [
+                        skill_scraper.measure_page_load(driver, page_url)
+                        for _ in range(repeats)
+                    ]
+                    for page_url in url
+                }
+            finally:
+                driver.quit()
+
+    with open(output, "w") as outfile:
+        json.dump(results, outfile, indent=2)
+
+    for profile_name, page_loads in results.items():
+        for page_url, loads in page_loads.items():
+            print(
+                f"{profile_name} {page_url}: "
+                f"{statistics.median(load['load_seconds'] for load in loads):.2f}s median load, "
+                f"{loads[0]['bytes_transferred'] / 2 ** 10:.0f}KB cold, "
+                f"{statistics.median(load['bytes_transferred'] for load in loads) / 2 ** 10:.0f}KB median, "
+                f"{loads[0]['blocked_requests']} requests blocked"
+            )
+
+
+if __name__ == "__main__":
+    app()
@@ -1,17 +1,26 @@
 import json
+import os
 import random
 import time
 
 import typer
 
+import extraction
+import instrumentation
+import lexicon
 import model
+import profiling
 import prompt
+import registry
 import resume_parser
+import results_store as results_store_module
 import skill_scraper
 
 ENV_RESOURCES = "resources/"
 
 
+@profiling.profiled
+@instrumentation.instrumented
 def main(
     resume_path: str = typer.Argument(
         ..., help="path to resume. resume must be in PDF form"
@@ -61,14 +70,107 @@ def main(
             "(bot detection from LinkedIn and Google).  [default: False]"
         ),
     ),
+    browser_profile: str = typer.Option(
+        "default",
+        help=(
+            "LinkedIn scraper option. 'default' (a full Chrome window) or 'lean' (headless, "
+            "no images, media or trackers)"
+        ),
+    ),
+    chrome_profile_dir: str = typer.Option(
+        "",
+        help=(
+            "LinkedIn scraper option. Chrome user data directory to reuse so LinkedIn stays logged "
+            "in. it holds the LinkedIn session cookies, so keep it out of version control"
+        ),
+    ),
+    base_model: str = typer.Option(
+        "lg",
+        help=(
+            "base spaCy pipeline to train the skill recognizer on top of. one of sm, md, lg, the name "
+            "of an installed pipeline package or the path of a saved pipeline"
+        ),
+    ),
+    n_process: int = typer.Option(
+        1, help="number of processes to use when looking for skills in the resume"
+    ),
+    metrics_jsonl: str = typer.Option(
+        "",
+        help="file to append the wall time, CPU time and peak RSS of each pipeline stage to as JSON lines",
+    ),
+    metrics_prometheus: str = typer.Option(
+        "",
+        help="file to write the pipeline stage metrics to in the Prometheus text format",
+    ),
+    profile: bool = typer.Option(
+        False,
+        "--profile",
+        help="profile the run and write a flamegraph compatible profile and a hot function summary",
+    ),
+    profile_output: str = typer.Option(
+        "profile", help="path prefix of the profile output files"
+    ),
+    profile_mode: str = typer.Option(
+        "sampling",
+        help="'sampling' (low overhead, broken down by pipeline stage) or 'deterministic' (cProfile)",
+    ),
+    serving_model: str = typer.Option(
+        "",
+        help=(
+            "directory of a trained pipeline pruned down to what skill extraction needs. if the "
+            "directory doesn't exist yet the model is trained and the pruned pipeline saved there, "
+            "otherwise training is skipped and the saved pipeline is used"
+        ),
+    ),
+    incremental: bool = typer.Option(
+        False,
+        "--incremental",
+        help=(
+            "when using a saved --serving-model, first fine-tune it on the skills in "
+            "resources/scraped_skills.txt it wasn't trained on yet  [default: False]"
+        ),
+    ),
+    model_registry: str = typer.Option(
+        "",
+        help=(
+            "registry file of pipelines trained for specific job queries. if one is registered for "
+            "the --job_query terms it's used as the --serving-model, and a newly trained "
+            "--serving-model is registered for them"
+        ),
+    ),
+    results_store: str = typer.Option(
+        "",
+        help=(
+            "directory of a Parquet store to append the extraction results to, e.g. "
+            f"{results_store_module.RESULTS_STORE_PATH}. the results include the names and skills found in the "
+            "resumes, so they're only stored when asked for"
+        ),
+    ),
+    training_corpus: str = typer.Option(
+        "",
+        help=(
+            "directory of a compiled training corpus. if the directory doesn't exist yet the corpus is "
+            "built from the skills file and revision data and saved there, otherwise it's reused as is"
+        ),
+    ),
+    lexicon_screen: bool = typer.Option(
+        False,
+        "--lexicon-screen",
+        help=(
+            "screen the resume with the skill lexicon distilled into the pipeline (see lexicon.py) "
+            "before running the model. if it has no known skills, only the name is taken from the "
+            "model  [default: False]"
+        ),
+    ),
 ):
-
     # -------------------------
     # | resume parser section |
     # -------------------------
 
     # turn the read in resume into a Python string (PDF format)
+    parse_start = time.perf_counter()
     resume_string = resume_parser.resume_parser(resume_path)
+    parse_seconds = time.perf_counter() - parse_start
 
     # -----------------------
     # | web scraper section |
@@ -77,7 +179,10 @@ def main(
     # only use this part if the user wants to scrape additional, job relevant skills from
     # LinkedIn. time intensive and runs the risk of being flagged by bot detection
     if linkedin_scraper:
-        scraper_driver = skill_scraper.initialize_web_scraper()
+        scraper_driver = skill_scraper.initialize_web_scraper(
+            profile_dir=chrome_profile_dir,
+            **skill_scraper.browser_profile_options(browser_profile),
+        )
         try:
             with open(credentials, "r") as infile:
                 credentials = json.load(infile)
@@ -113,6 +218,7 @@ def main(
 
         # keep track of the profiles that have already been scraped
         scraped_profiles = []
+        seen_profiles = skill_scraper.SeenProfiles(skill_scraper.SEEN_PROFILES_PATH)
 
         for user_profile in user_profiles:
             try:
@@ -131,6 +237,9 @@ def main(
                         outfile.write("\n")
                     all_relevant_skills = all_relevant_skills.union(scraped_skills)
                     scraped_profiles.append(user_profile)
+                    seen_profiles.add(
+                        [skill_scraper.normalize_profile_url(user_profile.strip())]
+                    )
 
             except IndexError:
                 continue
@@ -139,60 +248,126 @@ def main(
                 # dump profiles that haven't been scraped yet to reduce next restart's runtime in case of error
                 skipped_profiles = list(set(user_profiles) - set(scraped_profiles))
                 with open(ENV_RESOURCES + "user_profiles.txt", "w") as outfile:
-                    outfile.write("".join(skipped_profiles))
+                    outfile.write(
+                        "".join(f"{profile.strip()}\n" for profile in skipped_profiles)
+                    )
 
     # -------------------------------------
     # |   spaCy model training section    |
     # -------------------------------------
 
-    # generate test/train data from the scraped skills test file
-    if not linkedin_scraper:
-        print("Using previously generated resources/scraped_skills.txt file")
-    skill_file = model.SkillFile(ENV_RESOURCES + "scraped_skills.txt")
-    skill_file.length_split()
-
-    # use a set sentence templates to randomly fill with skills and generate test/train
-    # data
-    sentence_templates = model.SentenceTemplate(
-        ENV_RESOURCES + "skill_sentence_templates.txt"
-    )
-    test_skill_data, train_skill_data = sentence_templates.test_train_split(
-        skill_file.skills_list
-    )
-
-    # generate revision data to train on to try to prevent catastrophic forgetting
-    # problem
-    revision_data = model.RevisionData(
-        ENV_RESOURCES + "teddy_roosevelt_autobiography.txt"
-    )
-    revision_data.import_text()
-
-    # generate the model, update it with skills, and evaluate it
-    nlp = model.NLP()
-    revision_sentences = nlp.get_sentences(revision_data.text)
-    revision_sentences_trimmed = nlp.filter_sentences(revision_sentences)
-    revision_data.revisions = nlp.predict_entities(revision_sentences_trimmed)
+    if model_registry:
+        domain_registry = registry.ModelRegistry(model_registry)
+        serving_model = domain_registry.resolve(job_query, default=serving_model)
+
+    if serving_model and os.path.isdir(serving_model):
+        # a trained and pruned pipeline is already available, no need to train again
+        print(f"Using previously trained serving pipeline {serving_model}")
+        nlp = model.NLP(serving_model)
+
+        # only train on the skills the saved pipeline hasn't seen yet
+        if incremental:
+            model.incremental_update(
+                nlp,
+                serving_model,
+                ENV_RESOURCES + "scraped_skills.txt",
+                ENV_RESOURCES + "skill_sentence_templates.txt",
+            )
+        elif model.modified_since(ENV_RESOURCES + "scraped_skills.txt", serving_model):
+            print(
+                f"Warning: resources/scraped_skills.txt changed after {serving_model} was "
+                "trained, so the new skills aren't in it. rerun with --incremental to train "
+                "on them"
+            )
+    else:
+        nlp = model.NLP(base_model)
 
-    test_revision_data, train_revision_data = revision_data.test_train_split()
+        # a corpus is only reused if it has shards and was compiled from the current skills
+        reuse_corpus = bool(
+            training_corpus and model.TrainingCorpus(training_corpus).shard_paths
+        )
+        if reuse_corpus and model.modified_since(
+            ENV_RESOURCES + "scraped_skills.txt", training_corpus
+        ):
+            print(
+                f"resources/scraped_skills.txt changed after {training_corpus} was "
+                "compiled, rebuilding it"
+            )
+            reuse_corpus = False
 
-    combined_training_data = [
-        sentence for value in train_skill_data.values() for sentence in value
-    ] + train_revision_data
+        if reuse_corpus:
+            print(f"Using previously compiled training corpus {training_corpus}")
+            training_data = model.TrainingCorpus(training_corpus)
+        else:
+            # generate test/train data from the scraped skills test file and revision data
+            # to train on to try to prevent catastrophic forgetting problem
+            if not linkedin_scraper:
+                print("Using previously generated resources/scraped_skills.txt file")
+            _, training_data = model.build_data_sets(
+                nlp,
+                ENV_RESOURCES + "scraped_skills.txt",
+                ENV_RESOURCES + "skill_sentence_templates.txt",
+                ENV_RESOURCES + "teddy_roosevelt_autobiography.txt",
+            )
 
-    nlp.update_entity_recognition(combined_training_data, iterations=30)
+            # compile the training data so the next run can skip building it
+            if training_corpus:
+                corpus = model.TrainingCorpus(training_corpus)
+                corpus.build(nlp.nlp, training_data)
+                training_data = corpus
+
+        # update the model with skills
+        nlp.update_entity_recognition(training_data, iterations=30)
+
+        # save only what extraction needs so later runs can skip training and load faster
+        if serving_model:
+            nlp.save_serving_pipeline(serving_model)
+            model.save_training_record(
+                serving_model,
+                training_data,
+                nlp,
+                skill_path=ENV_RESOURCES + "scraped_skills.txt",
+            )
+            if model_registry:
+                domain_registry.register(job_query, serving_model)
 
     # get the skills from the resume
     # see if result from lower casing the resume string helps since training data
     # was lower case
-    doc_1 = nlp.nlp(resume_string)
-    user_name = None
-
-    skills_list = []
-    for entity in doc_1.ents:
-        if entity.label_ == "SKILL" and len(entity.text.split(" ")) <= 2:
-            skills_list.append(entity.text)
-        if not user_name and entity.label_ == "PERSON" and entity.text:
-            user_name = entity.text
+    # the resume is split into short segments along bullets, delimiters and lines so
+    # bulleted skill lists aren't read as one entity, and the segments are processed in
+    # batches. only the entity recognizer is needed, so skip the tagger, parser, etc.
+    skill_lexicon = (
+        lexicon.SkillLexicon.from_model(nlp.base_model) if lexicon_screen else None
+    )
+    extraction_start = time.perf_counter()
+    with nlp.nlp.select_pipes(enable=nlp.serving_components()):
+        resume_entities = extraction.extract_entities(
+            nlp.nlp,
+            resume_string,
+            labels=("SKILL", "PERSON"),
+            batch_size=128,
+            n_process=n_process,
+            segment=True,
+            lexicon=skill_lexicon,
+        )
+    extraction_seconds = time.perf_counter() - extraction_start
+    skills_list, user_name = extraction.summarize_entities(resume_entities)
+
+    # keep the results for analytics across runs
+    if results_store:
+        with results_store_module.ResultsStore(results_store) as store:
+            store.add(
+                resume_string,
+                resume_entities,
+                results_store_module.model_version(nlp),
+                resume_path,
+                company_name,
+                role_name,
+                job_query,
+                parse_seconds,
+                extraction_seconds,
+            )
 
     user_name_input = input(
         (
@@ -207,51 +382,13 @@ def main(
     # | prompt writing  |
     # -------------------
 
-    skills_string_start = "I am experienced in "
-    skills_string, choices_left = prompt.make_prompt_sentence(
-        skills_list, skills_string_start
-    )
-
-    motivation_string_start = (
-        "I am excited about this role because it will let me leverage my abilities in "
-    )
-    motivation_string_end = " to create impactful solutions."
-    motivation_string, num_choices_left = prompt.make_prompt_sentence(
-        skills_list,
-        motivation_string_start,
-        motivation_string_end,
-        num_choices=choices_left,
-    )
-
-    field_of_interest = random.sample(list(set(job_query)), k=1)
-    passion_string = f"I am passionate about solving problems at the intersection of {field_of_interest[0]} and social good."
-
-    if recipient_role:
-        imperative_statement = (
-            f"Write a cover letter to {recipient_role} from {user_name} for a "
-            f"{role_name} job at {company_name}."
+    with instrumentation.stage("prompt_generation"):
+        prompt_text = prompt.make_cover_letter_prompt(
+            skills_list, user_name, company_name, role_name, job_query, recipient_role
         )
-    else:
-        imperative_statement = (
-            f"Write a cover letter to {company_name} from {user_name} for a "
-            f"{role_name} job at {company_name}."
-        )
-
-    gpt_prompt = " ".join([skills_string, motivation_string, passion_string])
 
     with open("auto_generated_prompt.txt", "w") as outfile:
-        outfile.write(
-            "\n".join(
-                [
-                    (
-                        "# USE THE FOLLOWING AUTOGENERATED PROMPT AS A SUBMISSION TO GPT-3 OR CHATGPT TO GET YOUR "
-                        "COVER LETTER\n"
-                    ),
-                    imperative_statement,
-                    gpt_prompt,
-                ]
-            )
-        )
+        outfile.write(prompt_text)
 
 
 if __name__ == "__main__":
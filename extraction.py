@@ -0,0 +1,285 @@
+import re
+from collections import namedtuple
+
+import instrumentation
+
+# an entity found in a document. start_char/end_char are offsets in the whole document, not
+# in the chunk the entity was found in
+Entity = namedtuple("Entity", ["start_char", "end_char", "label", "text"])
+
+# sections of a resume are usually separated by at least one blank line
+SECTION_PATTERN = re.compile(r"\n\s*\n")
+LINE_PATTERN = re.compile(r"\n")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+# bullet glyphs, including the private use area ones Tika leaves in from Word/Symbol fonts
+BULLETS = "•◦▪▫●○■□➢➤►▶✓✔·\uf0b7\uf0a7\uf076\uf0d8"
+# a bullet or list number at the start of a line
+LINE_BULLET_PATTERN = re.compile(rf"[ \t]*(?:[{BULLETS}*\-–]|\(?\d{{1,2}}[.)])[ \t]+")
+# separators resumes use to put several items on one line
+INLINE_DELIMITER_PATTERN = re.compile(rf"[{BULLETS}|;\t]|\s[-–—]\s|\s{{3,}}")
+COMMA_PATTERN = re.compile(r",")
+
+
+def split_spans(text: str, start: int, stop: int, pattern: re.Pattern) -> list:
+    """
+    split text[start:stop] on a pattern, keeping track of where each piece starts
+
+    :param text: the full text
+    :param start: start of the region to split
+    :param stop: end of the region to split
+    :param pattern: compiled pattern to split on
+    :return: (start, stop) offsets of each non-empty piece in the full text
+    """
+    spans = []
+    piece_start = start
+    for match in pattern.finditer(text, start, stop):
+        if match.start() > piece_start:
+            spans.append((piece_start, match.start()))
+        piece_start = match.end()
+    if stop > piece_start:
+        spans.append((piece_start, stop))
+
+    return spans
+
+
+def chunk_document(text: str, max_chars: int = 5000) -> list:
+    """
+    split a document into chunks of at most max_chars characters. the document is split on
+    sections first, then on lines (bullets are on their own line in parsed resumes), and only
+    on whitespace for lines that are still too long. neighbouring pieces are packed back
+    together up to max_chars so chunks aren't needlessly small
+
+    :param text: the document to chunk
+    :param max_chars: the maximum length of a chunk
+    :return: (offset, chunk text) tuples, where offset is the start of the chunk in text
+    """
+    pieces = []
+    for section in split_spans(text, 0, len(text), SECTION_PATTERN):
+        if section[1] - section[0] <= max_chars:
+            pieces.append(section)
+            continue
+
+        for line in split_spans(text, *section, LINE_PATTERN):
+            if line[1] - line[0] <= max_chars:
+                pieces.append(line)
+                continue
+
+            # hard split an overly long line on the last whitespace that fits
+            line_start, line_stop = line
+            while line_stop - line_start > max_chars:
+                split_idx = text.rfind(" ", line_start, line_start + max_chars)
+                if split_idx <= line_start:
+                    split_idx = line_start + max_chars
+                pieces.append((line_start, split_idx))
+                line_start = split_idx
+            pieces.append((line_start, line_stop))
+
+    chunks = []
+    chunk_start, chunk_stop = None, None
+    for piece_start, piece_stop in pieces:
+        if chunk_start is not None and piece_stop - chunk_start <= max_chars:
+            chunk_stop = piece_stop
+            continue
+        if chunk_start is not None:
+            chunks.append((chunk_start, text[chunk_start:chunk_stop]))
+        chunk_start, chunk_stop = piece_start, piece_stop
+    if chunk_start is not None:
+        chunks.append((chunk_start, text[chunk_start:chunk_stop]))
+
+    return chunks
+
+
+def is_item_list(text: str, start: int, stop: int, max_item_words: int = 4) -> bool:
+    """
+    whether a comma separated piece of text is a list of short items (like a skills line)
+    rather than a sentence with commas in it
+
+    :param text: the full text
+    :param start: start of the piece
+    :param stop: end of the piece
+    :param max_item_words: the maximum number of words in an item of a list
+    :return:
+    """
+    piece = text[start:stop].strip()
+    items = piece.split(",")
+    if len(items) < 3 or piece.endswith("."):
+        return False
+
+    return all(len(item.split()) <= max_item_words for item in items)
+
+
+def segment_document(text: str, max_chars: int = 500) -> list:
+    """
+    split resume text into short segments along its layout: lines, bullets, inline
+    delimiters (|, ;, tabs, wide gaps) and comma separated item lists. keeps each item of a
+    bulleted skills list in its own segment so the model doesn't read the list as one entity
+
+    :param text: the resume text, e.g. from resume_parser.resume_parser
+    :param max_chars: segments longer than this are chunked further with chunk_document
+    :return: (offset, segment text) tuples, where offset is the start of the segment in text
+    """
+    segments = []
+    for line_start, line_stop in split_spans(text, 0, len(text), LINE_PATTERN):
+        bullet = LINE_BULLET_PATTERN.match(text, line_start, line_stop)
+        if bullet:
+            line_start = bullet.end()
+
+        for piece in split_spans(text, line_start, line_stop, INLINE_DELIMITER_PATTERN):
+            if is_item_list(text, *piece):
+                pieces = split_spans(text, *piece, COMMA_PATTERN)
+            else:
+                pieces = [piece]
+
+            for piece_start, piece_stop in pieces:
+                segment = text[piece_start:piece_stop]
+                stripped_segment = segment.strip()
+                if not stripped_segment:
+                    continue
+                piece_start += len(segment) - len(segment.lstrip())
+
+                if len(stripped_segment) <= max_chars:
+                    segments.append((piece_start, stripped_segment))
+                else:
+                    segments.extend(
+                        (piece_start + chunk_offset, chunk)
+                        for chunk_offset, chunk in chunk_document(
+                            stripped_segment, max_chars=max_chars
+                        )
+                    )
+
+    return segments
+
+
+def normalize_entity_text(entity_text: str) -> str:
+    return WHITESPACE_PATTERN.sub(" ", entity_text).strip().lower()
+
+
+def extract_entities(
+    nlp,
+    text: str,
+    labels: tuple = None,
+    max_chars: int = None,
+    batch_size: int = 16,
+    n_process: int = 1,
+    unique: bool = True,
+    segment: bool = False,
+    lexicon=None,
+) -> list:
+    """
+    find the entities in a document of any length by running its chunks through nlp.pipe
+
+    :param nlp: the spaCy Language object to run
+    :param text: the document
+    :param labels: only keep entities with one of these labels. keeps every label if not given
+    :param max_chars: the maximum length of a chunk. defaults to the splitter's own limit,
+        5000 characters for chunks and 500 for segments
+    :param batch_size: number of chunks to process at a time
+    :param n_process: number of processes nlp.pipe should use
+    :param unique: only keep the first occurrence of an entity with the same label and
+        (case/whitespace normalized) text
+    :param segment: split the document along its layout with segment_document instead of
+        into chunks. max_chars is then the maximum length of a segment
+    :param lexicon: a lexicon.SkillLexicon to screen the document with before any NER runs.
+        a document it finds no known skill in has no SKILL entities, and isn't run through
+        the model at all if SKILL is the only label asked for
+    :return: the entities in document order
+    """
+    return extract_batch(
+        nlp,
+        [text],
+        labels=labels,
+        max_chars=max_chars,
+        batch_size=batch_size,
+        n_process=n_process,
+        unique=unique,
+        segment=segment,
+        lexicon=lexicon,
+    )[0]
+
+
+def extract_batch(
+    nlp,
+    texts: list,
+    labels: tuple = None,
+    max_chars: int = None,
+    batch_size: int = 16,
+    n_process: int = 1,
+    unique: bool = True,
+    segment: bool = False,
+    lexicon=None,
+) -> list:
+    """
+    find the entities in several documents with a single nlp.pipe call over the chunks of
+    all of them. takes the same options as extract_entities
+
+    :return: the entities of each document, in the same order as texts
+    """
+    with instrumentation.stage(
+        "extraction", documents=len(texts), characters=sum(map(len, texts))
+    ) as record:
+        # the lexicon pass is a fraction of the cost of the model. it only screens for
+        # skills, so documents without a single known skill get no SKILL entities, and only
+        # skip the model entirely if SKILL is the only label asked for
+        screened = [lexicon is None or bool(lexicon.screen(text)) for text in texts]
+        record["screened_out"] = screened.count(False)
+        skills_only = bool(labels) and set(labels) <= {"SKILL"}
+
+        splitter = segment_document if segment else chunk_document
+        split_options = {} if max_chars is None else {"max_chars": max_chars}
+        entities = [[] for _ in texts]
+        seen = [set() for _ in texts]
+        for doc, (text_idx, offset) in nlp.pipe(
+            (
+                (chunk, (text_idx, chunk_offset))
+                for text_idx, text in enumerate(texts)
+                if screened[text_idx] or not skills_only
+                for chunk_offset, chunk in splitter(text, **split_options)
+            ),
+            as_tuples=True,
+            batch_size=batch_size,
+            n_process=n_process,
+        ):
+            for entity in doc.ents:
+                if labels and entity.label_ not in labels:
+                    continue
+                if entity.label_ == "SKILL" and not screened[text_idx]:
+                    continue
+
+                if unique:
+                    entity_key = (entity.label_, normalize_entity_text(entity.text))
+                    if entity_key in seen[text_idx]:
+                        continue
+                    seen[text_idx].add(entity_key)
+
+                entities[text_idx].append(
+                    Entity(
+                        offset + entity.start_char,
+                        offset + entity.end_char,
+                        entity.label_,
+                        entity.text,
+                    )
+                )
+
+        record["entities"] = sum(map(len, entities))
+
+    return entities
+
+
+def summarize_entities(entities: list, max_skill_words: int = 2) -> tuple:
+    """
+    pick the skills and the name of the person out of the entities found in a resume
+
+    :param entities: the entities found in the resume
+    :param max_skill_words: longer SKILL entities are left out
+    :return: the list of skills and the first PERSON found (None if there wasn't one)
+    """
+    user_name = None
+    skills_list = []
+    for entity in entities:
+        if entity.label == "SKILL" and len(entity.text.split(" ")) <= max_skill_words:
+            skills_list.append(entity.text)
+        if not user_name and entity.label == "PERSON" and entity.text:
+            user_name = entity.text
+
+    return skills_list, user_name
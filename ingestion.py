@@ -0,0 +1,348 @@
+import hashlib
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import typer
+
+import extraction
+import instrumentation
+import lexicon
+import model
+import prompt
+import resume_parser
+import results_store
+
+# put on a queue by the stage feeding it once it has nothing more to send
+_END_OF_QUEUE = None
+
+# pdf and doc files are parsed by the Tika server, so the parse is mostly waiting on HTTP and a
+# thread is enough. docx and txt files are parsed in-process and hold the GIL while they do
+TIKA_FILE_TYPES = (resume_parser.FileType.PDF, resume_parser.FileType.DOC)
+
+
+def timed_parse(resume_path: str) -> tuple:
+    """
+    :param resume_path: the resume to parse
+    :return: the text of the resume, the seconds it took to parse and the records of the
+        stages run while parsing. the records are sent back rather than recorded, since a
+        parse run in a worker process would record them in the worker's recorder
+    """
+    with instrumentation.recorder.collect() as records:
+        start = time.perf_counter()
+        text = resume_parser.resume_parser(resume_path)
+        parse_seconds = time.perf_counter() - start
+
+    return text, parse_seconds, records
+
+
+def prompt_path(output_dir: str, resume_path: str) -> str:
+    """
+    :param output_dir: directory the prompts are written to
+    :param resume_path: the resume the prompt is for
+    :return: <output_dir>/<resume name>_<path hash>_prompt.txt. the hash of the resume's full
+        path keeps resumes with the same name in different directories from overwriting
+        each other's prompts
+    """
+    resume_name = os.path.splitext(os.path.basename(resume_path))[0]
+    path_hash = hashlib.sha1(os.path.abspath(resume_path).encode()).hexdigest()[:8]
+    return os.path.join(output_dir, f"{resume_name}_{path_hash}_prompt.txt")
+
+
+def run_ingestion(
+    nlp: model.NLP,
+    resume_paths: list,
+    output_dir: str,
+    company_name: str,
+    role_name: str,
+    job_query: list,
+    recipient_role: str = "",
+    parse_threads: int = 4,
+    parse_processes: int = 2,
+    batch_size: int = 16,
+    queue_size: int = 64,
+    writers: int = 2,
+    store: results_store.ResultsStore = None,
+    skill_lexicon: lexicon.SkillLexicon = None,
+) -> dict:
+    """
+    parse a set of resumes, extract their entities and write a prompt for each one, with the
+    three stages running at the same time so the parsing I/O is overlapped with the NER.
+    parsed resumes are handed to the NER stage, and extracted entities to the prompt
+    writers, over bounded queues. at most queue_size resumes are parsed ahead of the NER
+    stage, so a slow model holds the parsers back instead of filling up memory
+
+    :param nlp: the NLP wrapper with the trained SKILL entity recognizer
+    :param resume_paths: the resumes to process
+    :param output_dir: directory the prompts are written to, named by prompt_path
+    :param company_name: company to submit the CVs to
+    :param role_name: role at the company the CVs are for
+    :param job_query: job tags applicable to the position
+    :param recipient_role: role of the person at the company receiving the CVs
+    :param parse_threads: number of threads parsing resumes with Tika
+    :param parse_processes: number of processes parsing docx and txt resumes
+    :param batch_size: maximum number of resumes run through the model at once
+    :param queue_size: maximum number of parsed resumes waiting on the NER stage
+    :param writers: number of threads writing prompts
+    :param store: if given, the extraction results of every resume are added to it
+    :param skill_lexicon: if given, resumes it finds no known skill in get no skills from
+        the model
+    :return: the number of resumes parsed, failed and written, the time taken and the throughput
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    parsed_queue = queue.Queue(maxsize=queue_size)
+    write_queue = queue.Queue(maxsize=queue_size)
+    # taken when a resume is submitted for parsing and released once the NER stage has it, so
+    # resumes still being parsed count towards queue_size too
+    in_flight = threading.BoundedSemaphore(queue_size)
+    counts = {"parsed": 0, "failed": 0, "written": 0}
+    counts_lock = threading.Lock()
+    version = results_store.model_version(nlp) if store else None
+    prompt_engine = prompt.PromptEngine()
+    fields = tuple(dict.fromkeys(job_query))
+
+    def count(key: str):
+        with counts_lock:
+            counts[key] += 1
+
+    def produce():
+        thread_pool = ThreadPoolExecutor(max_workers=parse_threads)
+        # forking from a process with a loaded model and running threads can copy locks held
+        # by the other threads into the child, so the parse processes are spawned
+        process_pool = ProcessPoolExecutor(
+            max_workers=parse_processes,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+
+        def on_parsed(resume_path, future):
+            try:
+                text, parse_seconds, records = future.result()
+                for record in records:
+                    instrumentation.recorder.add(record)
+            except Exception as error:
+                print(f"Failed to parse {resume_path}: {error}")
+                text = None
+
+            if text:
+                count("parsed")
+                parsed_queue.put((resume_path, text, parse_seconds))
+            else:
+                count("failed")
+                in_flight.release()
+
+        try:
+            for resume_path in resume_paths:
+                file_type = resume_parser.get_file_type(resume_path)
+                if file_type is resume_parser.FileType.UNSUPPORTED:
+                    print(f"Skipping {resume_path}: unsupported file type")
+                    count("failed")
+                    continue
+
+                in_flight.acquire()
+                pool = thread_pool if file_type in TIKA_FILE_TYPES else process_pool
+                future = pool.submit(timed_parse, resume_path)
+                future.add_done_callback(
+                    lambda future, resume_path=resume_path: on_parsed(
+                        resume_path, future
+                    )
+                )
+        finally:
+            thread_pool.shutdown()
+            process_pool.shutdown()
+            parsed_queue.put(_END_OF_QUEUE)
+
+    def recognize():
+        finished = False
+        try:
+            with nlp.nlp.select_pipes(enable=nlp.serving_components()):
+                while not finished:
+                    batch = [parsed_queue.get()]
+                    while len(batch) < batch_size:
+                        try:
+                            batch.append(parsed_queue.get_nowait())
+                        except queue.Empty:
+                            break
+
+                    if batch[-1] is _END_OF_QUEUE:
+                        finished = True
+                        batch.pop()
+                    if not batch:
+                        continue
+
+                    for _ in batch:
+                        in_flight.release()
+
+                    queued = 0
+                    try:
+                        extraction_start = time.perf_counter()
+                        resume_entities = extraction.extract_batch(
+                            nlp.nlp,
+                            [text for _, text, _ in batch],
+                            labels=("SKILL", "PERSON"),
+                            batch_size=batch_size,
+                            segment=True,
+                            lexicon=skill_lexicon,
+                        )
+                        # the batch is processed together, so each resume gets an equal share
+                        extraction_seconds = (
+                            time.perf_counter() - extraction_start
+                        ) / len(batch)
+
+                        for (resume_path, text, parse_seconds), entities in zip(
+                            batch, resume_entities
+                        ):
+                            if store:
+                                store.add(
+                                    text,
+                                    entities,
+                                    version,
+                                    resume_path,
+                                    company_name,
+                                    role_name,
+                                    job_query,
+                                    parse_seconds,
+                                    extraction_seconds,
+                                )
+                            write_queue.put((resume_path, entities))
+                            queued += 1
+                    except Exception as error:
+                        print(
+                            f"Failed to extract entities from a batch of {len(batch)} resumes: {error}"
+                        )
+                        for _ in range(len(batch) - queued):
+                            count("failed")
+        finally:
+            # if this stage died, keep taking resumes off the queue so the parsers never block
+            # on it, and always tell the writers there's nothing more coming
+            while not finished:
+                item = parsed_queue.get()
+                if item is _END_OF_QUEUE:
+                    finished = True
+                else:
+                    in_flight.release()
+                    count("failed")
+            for _ in range(writers):
+                write_queue.put(_END_OF_QUEUE)
+
+    def write():
+        while (item := write_queue.get()) is not _END_OF_QUEUE:
+            resume_path, entities = item
+            try:
+                skills_list, user_name = extraction.summarize_entities(entities)
+                if not skills_list:
+                    print(f"No skills found in {resume_path}")
+                    count("failed")
+                    continue
+
+                prompt_text = prompt_engine.render(
+                    prompt.normalize_skills(skills_list),
+                    user_name or "me",
+                    company_name,
+                    role_name,
+                    fields,
+                    recipient_role,
+                )
+                with open(prompt_path(output_dir, resume_path), "w") as outfile:
+                    outfile.write(prompt_text)
+                count("written")
+            except Exception as error:
+                print(f"Failed to write a prompt for {resume_path}: {error}")
+                count("failed")
+
+    with instrumentation.stage("ingestion", resumes=len(resume_paths)) as record:
+        start = time.perf_counter()
+        threads = [
+            threading.Thread(target=produce),
+            threading.Thread(target=recognize),
+        ] + [threading.Thread(target=write) for _ in range(writers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        record.update(counts)
+
+    return {
+        **counts,
+        "seconds": elapsed,
+        "resumes_per_second": counts["written"] / elapsed if elapsed else 0.0,
+    }
+
+
+def main(
+    model_path: str = typer.Argument(..., help="trained (serving) pipeline to use"),
+    resume_paths: list[str] = typer.Argument(..., help="resumes to write prompts for"),
+    company_name: str = typer.Option(..., help="company to submit the CVs to"),
+    role_name: str = typer.Option(
+        ..., help="role at the company to submit the CVs for"
+    ),
+    job_query: list[str] = typer.Option(
+        ..., help="job tags applicable to the position. prepend each with --job_query"
+    ),
+    recipient_role: str = typer.Option(
+        "", help="role of person at company receiving the CVs"
+    ),
+    output_dir: str = typer.Option("prompts", help="directory to write the prompts to"),
+    parse_threads: int = typer.Option(
+        4, help="number of threads parsing resumes with Tika"
+    ),
+    parse_processes: int = typer.Option(
+        2, help="number of processes parsing docx and txt resumes"
+    ),
+    batch_size: int = typer.Option(
+        16, help="maximum number of resumes run through the model at once"
+    ),
+    queue_size: int = typer.Option(
+        64, help="maximum number of parsed resumes waiting on the model"
+    ),
+    writers: int = typer.Option(2, help="number of threads writing prompts"),
+    store_path: str = typer.Option(
+        "",
+        help=(
+            "directory of a Parquet store to append the extraction results to, e.g. "
+            f"{results_store.RESULTS_STORE_PATH}. the results include the names and skills found in the "
+            "resumes, so they're only stored when asked for"
+        ),
+    ),
+    lexicon_screen: bool = typer.Option(
+        False,
+        "--lexicon-screen",
+        help="take no skills from the model for resumes the pipeline's skill lexicon finds no known skill in",
+    ),
+):
+    store = results_store.ResultsStore(store_path) if store_path else None
+    try:
+        stats = run_ingestion(
+            model.NLP(model_path),
+            resume_paths,
+            output_dir,
+            company_name,
+            role_name,
+            job_query,
+            recipient_role,
+            parse_threads=parse_threads,
+            parse_processes=parse_processes,
+            batch_size=batch_size,
+            queue_size=queue_size,
+            writers=writers,
+            store=store,
+            skill_lexicon=(
+                lexicon.SkillLexicon.from_model(model_path) if lexicon_screen else None
+            ),
+        )
+    finally:
+        # keep the results of the resumes processed before a failure
+        if store:
+            store.flush()
+    for stat, value in stats.items():
+        print(
+            f"{stat}: {value:.2f}" if isinstance(value, float) else f"{stat}: {value}"
+        )
+
+
+if __name__ == "__main__":
+    typer.run(main)
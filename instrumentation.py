@@ -0,0 +1,253 @@
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows; peak RSS is left out of the records there
+    resource = None
+
+
+class Recorder:
+    """
+    collects the timing and resource usage of each pipeline stage and writes them out as
+    JSON lines and/or a Prometheus text file
+    """
+
+    def __init__(self):
+        self.__jsonl_path = None
+        self.__prometheus_path = None
+        self.__records = []
+        self.__lock = threading.Lock()
+        # per thread lists that capture the records instead, see collect
+        self.__collectors = threading.local()
+
+    @property
+    def records(self):
+        return self.__records
+
+    @property
+    def enabled(self):
+        return bool(self.__jsonl_path or self.__prometheus_path)
+
+    def configure(self, jsonl_path: str = None, prometheus_path: str = None):
+        """
+        :param jsonl_path: file to append a JSON line to after each stage
+        :param prometheus_path: file to write the aggregated stage metrics to in the
+            Prometheus text exposition format when write_prometheus is called
+        """
+        self.__jsonl_path = jsonl_path or None
+        self.__prometheus_path = prometheus_path or None
+        self.__records = []
+
+    def add(self, record: dict):
+        collected = getattr(self.__collectors, "records", None)
+        if collected is not None:
+            collected.append(record)
+            return
+
+        if not self.enabled:
+            return
+
+        with self.__lock:
+            self.__records.append(record)
+            if self.__jsonl_path:
+                with open(self.__jsonl_path, "a") as outfile:
+                    outfile.write(json.dumps(record) + "\n")
+
+    @contextmanager
+    def collect(self):
+        """
+        capture the records of the stages the current thread runs instead of recording them,
+        e.g. in a worker process whose recorder isn't configured, so they can be sent back
+        and added to the parent's recorder
+
+        :return: the list the records are captured in
+        """
+        previous = getattr(self.__collectors, "records", None)
+        self.__collectors.records = []
+        try:
+            yield self.__collectors.records
+        finally:
+            self.__collectors.records = previous
+
+    def write_prometheus(self):
+        """
+        write the wall time, CPU time and number of runs of each stage (summed over its runs),
+        the largest RSS growth and peak RSS growth of a run of each stage, and the peak RSS
+        of the process
+        """
+        if not self.__prometheus_path:
+            return
+
+        stage_totals = {}
+        peak_rss_bytes = 0
+        for record in self.__records:
+            totals = stage_totals.setdefault(
+                record["stage"],
+                {
+                    "wall_seconds": 0.0,
+                    "cpu_seconds": 0.0,
+                    "runs": 0,
+                    "rss_delta_bytes": 0,
+                    "peak_rss_growth_bytes": 0,
+                },
+            )
+            totals["wall_seconds"] += record["wall_seconds"]
+            totals["cpu_seconds"] += record["cpu_seconds"]
+            totals["runs"] += 1
+            for metric in ("rss_delta_bytes", "peak_rss_growth_bytes"):
+                totals[metric] = max(totals[metric], record.get(metric) or 0)
+            peak_rss_bytes = max(peak_rss_bytes, record.get("peak_rss_bytes") or 0)
+
+        lines = []
+        for metric, metric_type, help_text in (
+            ("wall_seconds", "counter", "wall clock time spent in the stage"),
+            ("cpu_seconds", "counter", "CPU time spent in the stage"),
+            ("runs", "counter", "number of times the stage ran"),
+            (
+                "rss_delta_bytes",
+                "gauge",
+                "largest growth in resident set size over a run of the stage",
+            ),
+            (
+                "peak_rss_growth_bytes",
+                "gauge",
+                "largest amount a run of the stage raised the peak resident set size by",
+            ),
+        ):
+            metric_name = (
+                f"cv_prompt_stage_{metric}_total"
+                if metric_type == "counter"
+                else f"cv_prompt_stage_{metric}"
+            )
+            lines.append(f"# HELP {metric_name} {help_text}")
+            lines.append(f"# TYPE {metric_name} {metric_type}")
+            for stage_name, totals in sorted(stage_totals.items()):
+                lines.append(f'{metric_name}{{stage="{stage_name}"}} {totals[metric]}')
+
+        lines.append(
+            "# HELP cv_prompt_peak_rss_bytes peak resident set size of the process"
+        )
+        lines.append("# TYPE cv_prompt_peak_rss_bytes gauge")
+        lines.append(f"cv_prompt_peak_rss_bytes {peak_rss_bytes}")
+
+        with open(self.__prometheus_path, "w") as outfile:
+            outfile.write("\n".join(lines) + "\n")
+
+
+def peak_rss_bytes():
+    """
+    :return: the peak resident set size of the process so far, or None if unavailable
+    """
+    if resource is None:
+        return None
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes everywhere else
+    if sys.platform == "darwin":
+        return max_rss
+    return max_rss * 1024
+
+
+def current_rss_bytes():
+    """
+    :return: the current resident set size of the process, or None if unavailable. only
+        read on Linux, from /proc
+    """
+    try:
+        with open("/proc/self/statm", "r") as infile:
+            return int(infile.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+# the recorder shared by every module
+recorder = Recorder()
+
+# thread id -> names of the stages currently running in that thread, outermost first. kept
+# per thread so stages running at the same time in different threads don't mix, and keyed by
+# id so the profiler can read the stages of the thread it samples from its own thread
+_active_stages = {}
+
+
+def active_stages(thread_id: int = None) -> list:
+    """
+    :param thread_id: the thread to get the stages of. defaults to the current thread
+    :return: the names of the stages currently running in the thread, outermost first
+    """
+    return list(_active_stages.get(thread_id or threading.get_ident(), ()))
+
+
+def configure(jsonl_path: str = None, prometheus_path: str = None):
+    recorder.configure(jsonl_path, prometheus_path)
+
+
+def instrumented(func):
+    """
+    decorator for typer entry points that have metrics_jsonl and metrics_prometheus options.
+    configures the recorder before the entry point runs and writes the Prometheus file after
+    it, whether it finished or failed
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        configure(kwargs.get("metrics_jsonl"), kwargs.get("metrics_prometheus"))
+        try:
+            return func(*args, **kwargs)
+        finally:
+            recorder.write_prometheus()
+
+    return wrapper
+
+
+@contextmanager
+def stage(name: str, **labels):
+    """
+    time a stage of the pipeline. extra fields can be added to the stage's record through
+    the yielded dict, e.g. the losses of a training epoch. cpu_seconds is the CPU time of
+    the thread running the stage, so stages running in other threads at the same time aren't
+    counted. process_cpu_seconds is the CPU time of the whole process, which includes the
+    threads a stage hands work to
+
+    :param name: name of the stage
+    :param labels: extra fields to add to the record, e.g. the file being parsed
+    :return:
+    """
+    record = {"stage": name, **labels}
+    # the peak RSS is a high-water mark over the life of the process, so a stage is only
+    # charged for what it added to it. the current RSS at either end shows what it kept
+    rss_start = current_rss_bytes()
+    peak_rss_start = peak_rss_bytes()
+    wall_start = time.perf_counter()
+    cpu_start = time.thread_time()
+    process_cpu_start = time.process_time()
+    thread_stages = _active_stages.setdefault(threading.get_ident(), [])
+    thread_stages.append(name)
+    try:
+        yield record
+    finally:
+        thread_stages.pop()
+        if not thread_stages:
+            _active_stages.pop(threading.get_ident(), None)
+        record["wall_seconds"] = time.perf_counter() - wall_start
+        record["cpu_seconds"] = time.thread_time() - cpu_start
+        record["process_cpu_seconds"] = time.process_time() - process_cpu_start
+        record["peak_rss_bytes"] = peak_rss_bytes()
+        record["peak_rss_growth_bytes"] = (
+            record["peak_rss_bytes"] - peak_rss_start
+            if peak_rss_start is not None
+            else None
+        )
+        record["rss_start_bytes"] = rss_start
+        record["rss_end_bytes"] = current_rss_bytes()
+        record["rss_delta_bytes"] = (
+            record["rss_end_bytes"] - rss_start if rss_start is not None else None
+        )
+        record["timestamp"] = time.time()
+        recorder.add(record)
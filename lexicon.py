@@ -0,0 +1,225 @@
+import json
+import os
+import re
+from collections import Counter
+
+import typer
+
+import model
+
+# tokens are runs of letters/digits plus the symbols that show up inside skill names
+# (c++, c#, node.js, ci/cd). trailing periods are sentence punctuation, not part of the skill
+TOKEN_PATTERN = re.compile(
+    r"[a-z0-9+#]+(?:[./\-][a-z0-9+#]+)*|\.[a-z0-9]+", re.IGNORECASE
+)
+
+# the key that marks the end of a skill in the trie. tokens are never empty, so it can't clash
+END_OF_SKILL = ""
+
+LEXICON_FILE_NAME = model.LEXICON_FILE_NAME
+
+
+def tokenize(text: str) -> list:
+    """
+    :param text: the text to split into lexicon tokens
+    :return: (start, end, lower cased token) tuples
+    """
+    return [
+        (match.start(), match.end(), match.group(0).lower())
+        for match in TOKEN_PATTERN.finditer(text)
+    ]
+
+
+class SkillLexicon:
+    """
+    a token trie of known skills for finding skills in text without running the model.
+    matching is a single left to right pass over the tokens of the text
+    """
+
+    def __init__(self, trie: dict = None):
+        self.__trie = trie if trie is not None else {}
+        self.__size = sum(1 for _ in self.skills())
+
+    @property
+    def trie(self):
+        return self.__trie
+
+    def __len__(self):
+        return self.__size
+
+    def add(self, skill: str):
+        tokens = [token for _, _, token in tokenize(skill)]
+        if not tokens:
+            return
+
+        node = self.__trie
+        for token in tokens:
+            node = node.setdefault(token, {})
+        if END_OF_SKILL not in node:
+            self.__size += 1
+        node[END_OF_SKILL] = " ".join(tokens)
+
+    def skills(self):
+        stack = [self.__trie]
+        while stack:
+            node = stack.pop()
+            for token, child in node.items():
+                if token == END_OF_SKILL:
+                    yield child
+                else:
+                    stack.append(child)
+
+    def screen(self, text: str) -> list:
+        """
+        find the known skills in a text. overlapping matches are resolved by taking the
+        longest skill starting at the leftmost position
+
+        :param text: the text to search
+        :return: (start_char, end_char, skill) tuples in text order
+        """
+        token_matches = list(TOKEN_PATTERN.finditer(text))
+        tokens = [token_match.group(0).lower() for token_match in token_matches]
+        root = self.__trie
+        matches = []
+        token_idx = 0
+        num_tokens = len(tokens)
+        while token_idx < num_tokens:
+            node = root.get(tokens[token_idx])
+            # most tokens don't start a skill, so check that before walking the trie
+            if node is None:
+                token_idx += 1
+                continue
+
+            longest_match = (
+                (token_idx, node[END_OF_SKILL]) if END_OF_SKILL in node else None
+            )
+            for end_idx in range(token_idx + 1, num_tokens):
+                node = node.get(tokens[end_idx])
+                if node is None:
+                    break
+                if END_OF_SKILL in node:
+                    longest_match = (end_idx, node[END_OF_SKILL])
+
+            if longest_match:
+                end_idx, skill = longest_match
+                matches.append(
+                    (
+                        token_matches[token_idx].start(),
+                        token_matches[end_idx].end(),
+                        skill,
+                    )
+                )
+                token_idx = end_idx + 1
+            else:
+                token_idx += 1
+
+        return matches
+
+    def to_disk(self, file_path: str):
+        with open(file_path, "w") as outfile:
+            json.dump(self.__trie, outfile, separators=(",", ":"))
+
+    @classmethod
+    def from_disk(cls, file_path: str):
+        with open(file_path, "r") as infile:
+            return cls(json.load(infile))
+
+    @classmethod
+    def from_model(cls, model_path: str):
+        """
+        :param model_path: a saved pipeline the lexicon was distilled into
+        :return: the lexicon that ships with the pipeline
+        """
+        lexicon_path = os.path.join(model_path, LEXICON_FILE_NAME)
+        if not os.path.isfile(lexicon_path):
+            raise FileNotFoundError(
+                f"No skill lexicon in {model_path}. distill one with lexicon.py first"
+            )
+
+        return cls.from_disk(lexicon_path)
+
+
+def distill_lexicon(
+    nlp: model.NLP,
+    texts,
+    skill_list: list = (),
+    min_count: int = 2,
+    max_words: int = 3,
+    batch_size: int = 64,
+) -> SkillLexicon:
+    """
+    run the trained model over a corpus and keep the SKILL spans it predicts consistently.
+    a span counts as high confidence when the model labels the same (normalized) text as a
+    SKILL at least min_count times and it's short enough to not be a merged bulleted list
+
+    :param nlp: the NLP wrapper with the trained SKILL entity recognizer
+    :param texts: an iterable of documents to run the model over
+    :param skill_list: known skills (e.g. the scraped skills) to add to the lexicon as is
+    :param min_count: the number of times a span has to be predicted to be kept
+    :param max_words: the maximum number of words in a kept span
+    :param batch_size: number of documents to process at a time
+    :return: the lexicon of the known and the distilled skills
+    """
+    span_counts = Counter()
+    with nlp.nlp.select_pipes(enable=nlp.serving_components()):
+        for doc in nlp.nlp.pipe(texts, batch_size=batch_size):
+            for entity in doc.ents:
+                if entity.label_ != "SKILL":
+                    continue
+                tokens = [token for _, _, token in tokenize(entity.text)]
+                if 0 < len(tokens) <= max_words:
+                    span_counts[" ".join(tokens)] += 1
+
+    skill_lexicon = SkillLexicon()
+    for skill in skill_list:
+        skill_lexicon.add(skill)
+
+    distilled_skills = [
+        skill for skill, count in span_counts.items() if count >= min_count
+    ]
+    for skill in distilled_skills:
+        skill_lexicon.add(skill)
+
+    print(
+        f"Skill lexicon: {len(skill_lexicon)} skills "
+        f"({len(distilled_skills)} distilled from {len(span_counts)} predicted spans)"
+    )
+
+    return skill_lexicon
+
+
+def main(
+    model_path: str = typer.Argument(
+        ..., help="trained pipeline to distill. the lexicon is saved inside it"
+    ),
+    corpus: list[str] = typer.Argument(
+        ..., help="text files to run the model over. every non-empty line is a document"
+    ),
+    skill_file: str = typer.Option(
+        "resources/scraped_skills.txt", help="skills file to merge into the lexicon"
+    ),
+    min_count: int = typer.Option(
+        2, help="number of times the model has to predict a span for it to be kept"
+    ),
+    max_words: int = typer.Option(3, help="maximum number of words in a kept span"),
+):
+    def corpus_lines():
+        for file_path in corpus:
+            with open(file_path, "rb") as infile:
+                for line in model.decode_text(infile.read()).splitlines():
+                    if line.strip():
+                        yield line
+
+    nlp = model.NLP(model_path)
+    skill_lexicon = distill_lexicon(
+        nlp,
+        corpus_lines(),
+        model.SkillFile(skill_file).skills_list if skill_file else (),
+        min_count=min_count,
+        max_words=max_words,
+    )
+    skill_lexicon.to_disk(os.path.join(model_path, LEXICON_FILE_NAME))
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -1,13 +1,25 @@
+import array
+import hashlib
+import itertools
+import json
+import multiprocessing
 import os
 import re
 import random
+import shutil
+import tempfile
+import time
 import warnings
+from collections.abc import Sequence
 
-import en_core_web_lg
+import numpy
+import spacy
 from charset_normalizer import from_bytes
+from spacy.tokens import DocBin
 from spacy.training import Example
 from spacy.util import compounding, minibatch
 
+import instrumentation
 import jsonl_skill_parser
 
 
@@ -22,6 +34,52 @@ def decode_text(encoded_text: bytes) -> str:
     return str(from_bytes(encoded_text).best())
 
 
+def bucketed_minibatch(
+    examples: list, max_tokens: int = 1000, bucket_width: int = 8, shuffle: bool = True
+):
+    """
+    group examples of similar token length together and batch them against a token
+    budget instead of an example count. the cost of a batch is counted as the longest
+    example in it times the number of examples since that's what the batch is padded to
+
+    :param examples: the Example objects to batch
+    :param max_tokens: the (padded) token budget of a single batch
+    :param bucket_width: examples whose lengths fall in the same window of this many
+        tokens are put in the same bucket
+    :param shuffle: shuffle the examples in each bucket and the order of the batches
+    :return: a generator of lists of Example objects
+    """
+    buckets = {}
+    for example in examples:
+        buckets.setdefault(len(example.reference) // bucket_width, []).append(example)
+
+    batches = []
+    for bucket_key in sorted(buckets.keys()):
+        bucket = buckets[bucket_key]
+        if shuffle:
+            random.shuffle(bucket)
+
+        batch, batch_max_length = [], 0
+        for example in bucket:
+            longest = max(batch_max_length, len(example.reference))
+            # start a new batch once adding the example would go over the token budget. an
+            # example longer than the budget still gets a batch to itself
+            if batch and longest * (len(batch) + 1) > max_tokens:
+                batches.append(batch)
+                batch, longest = [], len(example.reference)
+            batch.append(example)
+            batch_max_length = longest
+
+        if batch:
+            batches.append(batch)
+
+    # don't always present the short sentences to the model first
+    if shuffle:
+        random.shuffle(batches)
+
+    yield from batches
+
+
 class InputFile:
     """
     base class for different files
@@ -35,6 +93,178 @@ class InputFile:
         return self.__file_path
 
 
+class SkillTable(Sequence):
+    """
+    a compact, read-only table of unique skills. the skills are stored as one contiguous
+    UTF-8 buffer with an array of offsets into it instead of one Python string per skill,
+    and the word count and a 64 bit hash of every skill are precomputed into columns so
+    filtering, sampling and lookups are numpy operations over the columns
+    """
+
+    # strata used by the length split: one word, two words, and three or more words
+    word_count_strata = ((1, 1), (2, 2), (3, None))
+
+    def __init__(
+        self,
+        buffer: bytes,
+        offsets: numpy.ndarray,
+        word_counts: numpy.ndarray,
+        keys: numpy.ndarray,
+    ):
+        self.__buffer = buffer
+        self.__offsets = offsets
+        self.__word_counts = word_counts
+        self.__keys = keys
+        # order of the keys, for binary search lookups
+        self.__key_order = numpy.argsort(keys, kind="stable").astype(numpy.uint32)
+
+    @property
+    def word_counts(self):
+        return self.__word_counts
+
+    @property
+    def keys(self):
+        return self.__keys
+
+    @property
+    def nbytes(self):
+        return (
+            len(self.__buffer)
+            + self.__offsets.nbytes
+            + self.__word_counts.nbytes
+            + self.__keys.nbytes
+            + self.__key_order.nbytes
+        )
+
+    @staticmethod
+    def normalize(skill: str) -> str:
+        return " ".join(skill.lower().split())
+
+    @staticmethod
+    def key(normalized_skill: str) -> int:
+        return int.from_bytes(
+            hashlib.blake2b(normalized_skill.encode(), digest_size=8).digest(), "little"
+        )
+
+    @classmethod
+    def from_strings(cls, skills):
+        """
+        :param skills: an iterable of skills. they're normalized (lower cased, whitespace
+            collapsed) and only the first occurrence of each is kept
+        :return:
+        """
+        buffer = bytearray()
+        offsets = array.array("q", [0])
+        word_counts = array.array("H")
+        keys = array.array("Q")
+        seen_keys = set()
+        for skill in skills:
+            normalized_skill = cls.normalize(skill)
+            if not normalized_skill:
+                continue
+            key = cls.key(normalized_skill)
+            if key in seen_keys:
+                continue
+            seen_keys.add(key)
+
+            buffer += normalized_skill.encode()
+            offsets.append(len(buffer))
+            word_counts.append(normalized_skill.count(" ") + 1)
+            keys.append(key)
+
+        return cls(
+            bytes(buffer),
+            numpy.frombuffer(offsets, dtype=numpy.int64),
+            numpy.frombuffer(word_counts, dtype=numpy.uint16),
+            numpy.frombuffer(keys, dtype=numpy.uint64),
+        )
+
+    def __len__(self):
+        return len(self.__offsets) - 1
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return self.take(range(*idx.indices(len(self))))
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("skill table index out of range")
+
+        return self.__buffer[self.__offsets[idx] : self.__offsets[idx + 1]].decode()
+
+    def __iter__(self):
+        buffer = self.__buffer
+        offsets = self.__offsets.tolist()
+        for start, end in zip(offsets, offsets[1:]):
+            yield buffer[start:end].decode()
+
+    def __contains__(self, skill):
+        return self.index_of(skill) is not None
+
+    def index_of(self, skill: str):
+        """
+        :param skill: the skill to look up. normalized the same way the table's skills are
+        :return: the index of the skill in the table, or None if it isn't in the table
+        """
+        key = numpy.uint64(self.key(self.normalize(skill)))
+        position = numpy.searchsorted(self.__keys, key, sorter=self.__key_order)
+        if position < len(self) and self.__keys[self.__key_order[position]] == key:
+            return int(self.__key_order[position])
+        return None
+
+    def take(self, indices) -> list:
+        """
+        :param indices: indices of the skills to get
+        :return: the skills at the indices
+        """
+        return [self[int(idx)] for idx in indices]
+
+    def stratified_sample(
+        self, proportions: tuple, rng: numpy.random.Generator
+    ) -> list:
+        """
+        sample the skills in each word count stratum, taking a proportion of the whole table
+        from each (capped at the size of the stratum)
+
+        :param proportions: the share of the table to take from each of word_count_strata
+        :param rng: the numpy random generator to sample with
+        :return: the indices of the sampled skills of each stratum
+        """
+        sampled_indices = []
+        for (min_words, max_words), proportion in zip(
+            self.word_count_strata, proportions
+        ):
+            in_stratum = self.__word_counts >= min_words
+            if max_words is not None:
+                in_stratum &= self.__word_counts <= max_words
+            stratum_indices = numpy.flatnonzero(in_stratum)
+            sample_size = min(round(proportion * len(self)), len(stratum_indices))
+            sampled_indices.append(
+                rng.choice(stratum_indices, size=sample_size, replace=False)
+            )
+
+        return sampled_indices
+
+    def to_disk(self, file_path: str):
+        numpy.savez(
+            file_path,
+            buffer=numpy.frombuffer(self.__buffer, dtype=numpy.uint8),
+            offsets=self.__offsets,
+            word_counts=self.__word_counts,
+            keys=self.__keys,
+        )
+
+    @classmethod
+    def from_disk(cls, file_path: str):
+        with numpy.load(file_path) as columns:
+            return cls(
+                columns["buffer"].tobytes(),
+                columns["offsets"],
+                columns["word_counts"],
+                columns["keys"],
+            )
+
+
 class SkillFile(InputFile):
     """
     a file containing skills data that will be used to create a training set
@@ -45,12 +275,16 @@ class SkillFile(InputFile):
         :param file_path: file path of a file containing skills data
         """
         super().__init__(file_path)
-        self.__skills_list = self.parse_skills()
+        self.__skill_table = self.parse_skills()
         self.__training_skills = None
 
     @property
     def skills_list(self):
-        return self.__skills_list
+        return self.__skill_table
+
+    @property
+    def skill_table(self):
+        return self.__skill_table
 
     @property
     def training_skills(self):
@@ -60,27 +294,31 @@ class SkillFile(InputFile):
     def training_skills(self, value):
         self.__training_skills = value
 
-    def parse_skills(self) -> list:
+    def iter_skills(self):
         """
         read skill data from a file in. acceptable file formats are JSON Lines and raw text
         formatting specifications provided in README
 
-        :return:
+        :return: a generator of skills
         """
         if re.search(r"\.jsonl$", self.file_path):
             skills_objs = jsonl_skill_parser.get_skill_text(self.file_path, "pattern")
-            skills_list = jsonl_skill_parser.parse_jsonl_skills(skills_objs)
+            yield from jsonl_skill_parser.parse_jsonl_skills(skills_objs)
 
         elif re.search(r"\.txt$", self.file_path):
+            # detect the encoding once for the whole file rather than once per skill
             with open(self.file_path, "rb") as infile:
-                skills_list = [
-                    decode_text(skill).strip().lower() for skill in infile.readlines()
-                ]
+                for skill in decode_text(infile.read()).splitlines():
+                    yield skill.strip().lower()
 
         else:
             raise ValueError("Skill file is not formatted correctly")
 
-        return list(set(skills_list))
+    def parse_skills(self) -> SkillTable:
+        """
+        :return: the unique skills in the file
+        """
+        return SkillTable.from_strings(self.iter_skills())
 
     def length_split(self, proportions: tuple = (0.45, 0.30, 0.25)):
         """
@@ -90,43 +328,21 @@ class SkillFile(InputFile):
         :param proportions: the weighting for the split
         :return:
         """
-        # split the skills on how many words are in the skill name
-        length_dict = {"one_word": [], "two_word": [], "multi_word": []}
-
-        for skill in self.skills_list:
-            if len(skill.split()) == 1:
-                length_dict["one_word"].append(skill)
-            elif len(skill.split()) == 2:
-                length_dict["two_word"].append(skill)
-            elif len(skill.split()) >= 3:
-                length_dict["multi_word"].append(skill)
-
         # do an uneven split on skills depending on how many words are in the skill name to avoid bias
         # (ameliorate effect of spaCy training on using length of a token as a significant feature format
         # entity recognition)
-        total_num_skills = sum([len(value) for value in length_dict.values()])
-        [random.shuffle(length_dict[key]) for key in length_dict.keys()]
-
-        one_word_proportion, two_word_proportion, multi_word_proportion = proportions
-
-        train_one_word_skills = length_dict["one_word"][
-            : round(one_word_proportion * total_num_skills)
-        ]
-        train_two_word_skills = length_dict["two_word"][
-            : round(two_word_proportion * total_num_skills)
-        ]
-        train_multi_word_skills = length_dict["multi_word"][
-            : round(multi_word_proportion * total_num_skills)
-        ]
-        training_skills = (
-            train_one_word_skills + train_two_word_skills + train_multi_word_skills
+        rng = numpy.random.default_rng(random.getrandbits(32))
+        one_word_indices, two_word_indices, multi_word_indices = (
+            self.skill_table.stratified_sample(proportions, rng)
         )
 
-        print("1-worded skill entities: ", len(train_one_word_skills))
-        print("2-worded skill entities: ", len(train_two_word_skills))
-        print("3-or-more-worded skill entities: ", len(train_multi_word_skills))
+        print("1-worded skill entities: ", len(one_word_indices))
+        print("2-worded skill entities: ", len(two_word_indices))
+        print("3-or-more-worded skill entities: ", len(multi_word_indices))
 
-        self.training_skills = training_skills
+        self.training_skills = self.skill_table.take(
+            numpy.concatenate([one_word_indices, two_word_indices, multi_word_indices])
+        )
 
 
 class SentenceTemplate(InputFile):
@@ -134,9 +350,13 @@ class SentenceTemplate(InputFile):
     templates that are used to generate testing/training data sets
     """
 
+    # placeholder from sentence templates to replace with a skill from the scraped skill set
+    skill_placeholder = "{}"
+
     def __init__(self, file_path: str):
         super().__init__(file_path)
         self.__templates = self.import_templates()
+        self.__compiled_templates = self.compile_templates()
 
     @property
     def templates(self):
@@ -145,6 +365,11 @@ class SentenceTemplate(InputFile):
     @templates.setter
     def templates(self, value):
         self.__templates = value
+        self.__compiled_templates = self.compile_templates()
+
+    @property
+    def compiled_templates(self):
+        return self.__compiled_templates
 
     def import_templates(self):
         """
@@ -158,13 +383,77 @@ class SentenceTemplate(InputFile):
 
         return sentence_templates
 
-    def test_train_split(self, skill_list: list, sentence_limit: int = 100):
+    def compile_templates(self) -> list:
+        """
+        split every template on its skill placeholders once so filling a template doesn't
+        have to search for the placeholders again. templates without a placeholder are dropped
+
+        :return: a tuple of the literal text around the placeholders for each template
+        """
+        return [
+            tuple(template.split(self.skill_placeholder))
+            for template in self.templates
+            if self.skill_placeholder in template
+        ]
+
+    @staticmethod
+    def fill_template(template_segments: tuple, skills: list) -> tuple:
+        """
+        insert skills into a compiled template and annotate where they were inserted
+
+        :param template_segments: a compiled template from compile_templates
+        :param skills: one skill per placeholder in the template
+        :return: the filled sentence and its SKILL annotations
+        """
+        sentence_parts = [template_segments[0]]
+        entities = []
+        offset = len(template_segments[0])
+        for skill, segment in zip(skills, template_segments[1:]):
+            entities.append((offset, offset + len(skill), "SKILL"))
+            sentence_parts.append(skill)
+            sentence_parts.append(segment)
+            offset += len(skill) + len(segment)
+
+        return "".join(sentence_parts), {"entities": entities}
+
+    def generate(self, skill_list: list, skill_repeats: int = 1, seed: int = None):
+        """
+        lazily fill randomly picked templates with skills. every skill is used skill_repeats
+        times (a few left over skills at the end that can't fill a template are dropped)
+
+        :param skill_list: the list of skills
+        :param skill_repeats: how many times each skill should appear in the generated sentences
+        :param seed: seed for the random number generator. if not given the global random
+            state is used
+        :return: a generator of (sentence, annotations) tuples
+        """
+        rng = random.Random(seed) if seed is not None else random
+
+        def skill_stream():
+            for _ in range(skill_repeats):
+                shuffled_skills = list(skill_list)
+                rng.shuffle(shuffled_skills)
+                yield from shuffled_skills
+
+        skills = skill_stream()
+        while True:
+            template_segments = rng.choice(self.compiled_templates)
+            template_skills = list(itertools.islice(skills, len(template_segments) - 1))
+            if len(template_skills) < len(template_segments) - 1:
+                return
+
+            yield self.fill_template(template_segments, template_skills)
+
+    def test_train_split(
+        self, skill_list: list, sentence_limit: int = 100, seed: int = None
+    ):
         """
         helper function to distribute skill sentence cases
 
         :param skill_list: the list of skills
         :param sentence_limit: soft cap on number of sentences to generate for
             training data
+        :param seed: seed for the random number generator
         :return:
         """
 
@@ -199,61 +488,106 @@ class SentenceTemplate(InputFile):
             "three_skill_sentences": [],
         }
 
-        # placeholder from sentence templates to replace with a skill from the scraped skill set
-        skill_placeholder_pattern = "{}"
-
-        # shuffle the data before starting
-        random.shuffle(skill_list)
-
-        # the count that helps us decide when to break from the for loop
-        skill_entity_count = len(skill_list) - 1
-
-        # start the while loop, ensure we don't get an index out of bounds error
-        # since skill templates can use up to 3 skills
-        while skill_entity_count >= 2:
-            entities = []
+        # each skill is used once; append the sentence and the position of the entities to the
+        # correct dictionary and array
+        for skill_case in self.generate(skill_list, seed=seed):
+            num_skill_inserts = len(skill_case[1]["entities"])
+            add_case(test_data, training_data, num_skill_inserts, skill_case)
 
-            # pick a random skill template
-            sentence_template = self.templates[
-                random.randint(0, len(self.templates) - 1)
-            ]
-            num_skill_inserts = len(
-                re.findall(skill_placeholder_pattern, sentence_template)
-            )
+        return test_data, training_data
 
-            # for each brace, replace with a skill entity from the shuffled skill data
-            sentence_to_fill = sentence_template
 
-            # loop over all the skill placeholders in the template and replace with a random skill
-            placeholder_remaining = re.search(
-                skill_placeholder_pattern, sentence_to_fill
-            )
-            while placeholder_remaining:
-                random_skill = skill_list[skill_entity_count]
-                skill_entity_count -= 1
+class RehearsalSampler:
+    """
+    a single pass, entity label balanced reservoir sampler for revision data. every sentence
+    is assigned to the rarest label among its entities (counted over the stream so far) and
+    offered to that label's reservoir, so a sentence is kept at most once however many
+    entities it has. each reservoir holds at most train_quota + test_quota sentences, so
+    memory is bounded by the quotas and the number of labels, not by the size of the stream
+    """
 
-                # replace only one pattern at a time, so use .replace instead of re.sub
-                sentence_to_fill = sentence_to_fill.replace(
-                    skill_placeholder_pattern, random_skill, 1
-                )
+    def __init__(self, train_quota: int = 100, test_quota: int = 20, seed: int = None):
+        """
+        :param train_quota: maximum number of training sentences per entity label
+        :param test_quota: maximum number of testing sentences per entity label
+        :param seed: seed for the random number generator. drawn from the global random
+            module if not given, so random.seed() still makes the sample reproducible
+        """
+        self.__train_quota = train_quota
+        self.__test_quota = test_quota
+        self.__rng = random.Random(random.getrandbits(32) if seed is None else seed)
+        self.__reservoirs = {}
+        # number of sentences offered to each label's reservoir
+        self.__offered = {}
+        # texts currently held in any reservoir, to keep repeated sentences out
+        self.__held_texts = set()
 
-                # get the start and stop indices of the inserted skill
-                skill_length = len(random_skill)
-                replace_start_idx = placeholder_remaining.span()[0]
-                replace_stop_idx = skill_length + placeholder_remaining.span()[0]
+    @property
+    def capacity(self):
+        return self.__train_quota + self.__test_quota
 
-                # create a SKILL annotation for the inserted skill
-                entities.append((replace_start_idx, replace_stop_idx, "SKILL"))
+    def add(self, revision: tuple):
+        """
+        :param revision: a (text, {"entities": [(start, end, label), ...]}) tuple
+        :return:
+        """
+        text, annotations = revision
+        labels = {label for _, _, label in annotations["entities"]}
+        if not labels or text in self.__held_texts or not self.capacity:
+            return
+
+        label = min(sorted(labels), key=lambda label: self.__offered.get(label, 0))
+        reservoir = self.__reservoirs.setdefault(label, [])
+        self.__offered[label] = self.__offered.get(label, 0) + 1
+
+        if len(reservoir) < self.capacity:
+            reservoir.append(revision)
+            self.__held_texts.add(text)
+            return
+
+        # algorithm R: keep the nth sentence with probability capacity / n
+        replace_idx = self.__rng.randrange(self.__offered[label])
+        if replace_idx < self.capacity:
+            self.__held_texts.discard(reservoir[replace_idx][0])
+            reservoir[replace_idx] = revision
+            self.__held_texts.add(text)
+
+    def sample(self, *revision_streams):
+        """
+        :param revision_streams: one or more iterables of revision tuples, read once each
+        :return: the sampler
+        """
+        for revision in itertools.chain.from_iterable(revision_streams):
+            self.add(revision)
 
-                placeholder_remaining = re.search(
-                    skill_placeholder_pattern, sentence_to_fill
-                )
+        return self
 
-            # append the sentence and the position of the entities to the correct dictionary and array
-            skill_case = (sentence_to_fill, {"entities": entities})
-            add_case(test_data, training_data, num_skill_inserts, skill_case)
+    def test_train_split(self) -> tuple:
+        """
+        split every label's reservoir between testing and training. labels that didn't
+        fill their reservoir are split in the same proportion as the quotas
 
-        return test_data, training_data
+        :return: the testing data and the training data
+        """
+        testing_data = []
+        training_data = []
+        for label in sorted(self.__reservoirs):
+            reservoir = list(self.__reservoirs[label])
+            self.__rng.shuffle(reservoir)
+            num_testing = round(len(reservoir) * self.__test_quota / self.capacity)
+            testing_data.extend(reservoir[:num_testing])
+            training_data.extend(reservoir[num_testing:])
+
+        return testing_data, training_data
+
+    def label_counts(self) -> dict:
+        """
+        :return: the number of sentences seen and kept for each label
+        """
+        return {
+            label: {"offered": self.__offered[label], "kept": len(reservoir)}
+            for label, reservoir in sorted(self.__reservoirs.items())
+        }
 
 
 class RevisionData(InputFile):
@@ -305,61 +639,250 @@ class RevisionData(InputFile):
 
         self.text = raw_text[start_idx:stop_idx]
 
-    def test_train_split(self):
+    def test_train_split(
+        self, train_quota: int = 100, test_quota: int = 20, seed: int = None
+    ):
         """
-        helper function to add and keep tracking of what entities have been added to testing/training data sets
+        split the revisions into testing and training data, balanced across entity labels
+        and with every sentence used at most once
 
+        :param train_quota: maximum number of training sentences per entity label
+        :param test_quota: maximum number of testing sentences per entity label
+        :param seed: seed for the random number generator
         :return:
         """
+        sampler = RehearsalSampler(train_quota, test_quota, seed).sample(self.revisions)
+        revision_testing_data, revision_training_data = sampler.test_train_split()
 
-        def add_revision(entities, entity_counter, data_set):
-            for _, _, entity_label in entities:
-                if entity_label in entity_counter.keys():
-                    entity_counter[entity_label] += 1
-                else:
-                    entity_counter[entity_label] = 1
-                data_set.append(revision)
-
-        # create a test/train split for revision data
-        # aggregate the testing/training data
-        revision_training_data = []
-        revision_testing_data = []
-
-        # keep a counter of the number of entities being aggregated to keep the test/training data
-        # from being too lopsided
-        soft_entity_limit = 100
-
-        revision_testing_entity_counter = dict()
-        revision_training_entity_counter = dict()
-
-        random.shuffle(self.revisions)
-        for revision in self.revisions:
-            entities = revision[1]["entities"]
-
-            append_to_training = 0
-            for _, _, entity_label in entities:
-                if (
-                    entity_label in revision_training_entity_counter
-                    and revision_training_entity_counter[entity_label]
-                    >= soft_entity_limit
-                ):
-                    append_to_training -= 1
-                else:
-                    append_to_training += 1
+        print(f"Revision sentences per entity label: {sampler.label_counts()}")
 
-            if append_to_training >= 0:
-                add_revision(
-                    entities, revision_training_entity_counter, revision_training_data
-                )
-            else:
-                add_revision(
-                    entities, revision_testing_entity_counter, revision_testing_data
-                )
+        return revision_testing_data, revision_training_data
 
-        print(f"Revision Testing Data: {revision_testing_entity_counter}")
-        print(f"Revision Training Data: {revision_training_entity_counter}")
 
-        return revision_testing_data, revision_training_data
+class TrainingCorpus(InputFile):
+    """
+    a directory of pre-tokenized, serialized (DocBin) training data. the corpus is split
+    into shards so it can be built from and streamed into training without holding the
+    whole data set in memory
+    """
+
+    def __init__(self, file_path: str, shard_size: int = 10000):
+        """
+        :param file_path: directory the corpus shards are written to/read from
+        :param shard_size: maximum number of sentences in a single shard
+        """
+        super().__init__(file_path)
+        self.__shard_size = shard_size
+
+    @property
+    def shard_size(self):
+        return self.__shard_size
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.file_path, "manifest.json")
+
+    @property
+    def shard_paths(self) -> list:
+        if not os.path.isdir(self.file_path):
+            return []
+
+        # a corpus generated by several workers lists its shards in a manifest
+        if os.path.isfile(self.manifest_path):
+            with open(self.manifest_path, "r") as infile:
+                manifest = json.load(infile)
+            return [
+                os.path.join(self.file_path, shard_path)
+                for shard_path in manifest["shards"]
+            ]
+
+        return sorted(
+            os.path.join(self.file_path, file_name)
+            for file_name in os.listdir(self.file_path)
+            if file_name.endswith(".spacy")
+        )
+
+    def write_shard(self, doc_bin: DocBin, shard_idx: int):
+        doc_bin.to_disk(os.path.join(self.file_path, f"shard-{shard_idx:05d}.spacy"))
+
+    def build(self, nlp, training_data) -> list:
+        """
+        tokenize and annotate the training data and write it to disk. entity spans that
+        don't line up with token boundaries are found here instead of during training
+
+        :param nlp: the spaCy Language object whose tokenizer is used
+        :param training_data: an iterable of (text, annotations) tuples; can be a generator.
+            a list is shuffled before it's split into shards, so data built as consecutive
+            blocks (skill sentences, then revision sentences) is mixed within every shard
+            instead of each shard holding a single kind. a generator is written in order
+        :return: the sentences that were left out because their entities were misaligned
+        """
+        if isinstance(training_data, Sequence):
+            training_data = random.sample(training_data, k=len(training_data))
+
+        os.makedirs(self.file_path, exist_ok=True)
+        for shard_path in self.shard_paths:
+            os.remove(shard_path)
+        if os.path.isfile(self.manifest_path):
+            os.remove(self.manifest_path)
+
+        misaligned = []
+        doc_bin = DocBin(attrs=["ENT_IOB", "ENT_TYPE"], store_user_data=False)
+        num_docs, shard_idx = 0, 0
+
+        for text, annotations in training_data:
+            doc = nlp.make_doc(text)
+            spans = [
+                doc.char_span(start, end, label=label)
+                for start, end, label in annotations["entities"]
+            ]
+            if None in spans:
+                misaligned.append(text)
+                continue
+            try:
+                doc.ents = spans
+            except ValueError:
+                # overlapping entities
+                misaligned.append(text)
+                continue
+
+            doc_bin.add(doc)
+            num_docs += 1
+            if len(doc_bin) == self.shard_size:
+                self.write_shard(doc_bin, shard_idx)
+                doc_bin = DocBin(attrs=["ENT_IOB", "ENT_TYPE"], store_user_data=False)
+                shard_idx += 1
+
+        if len(doc_bin):
+            self.write_shard(doc_bin, shard_idx)
+
+        print(f"Training corpus: {num_docs} sentences, {len(misaligned)} misaligned")
+        if not num_docs:
+            raise ValueError(f"No training sentences were written to {self.file_path}")
+
+        return misaligned
+
+    def read_shards(self, nlp, shuffle: bool = True):
+        """
+        read the corpus back one shard at a time
+
+        :param nlp: the spaCy Language object used to make the predicted side of the examples
+        :param shuffle: shuffle the shard order and the examples within each shard
+        :return: a generator of lists of Example objects, one list per shard
+        """
+        shard_paths = self.shard_paths
+        if shuffle:
+            random.shuffle(shard_paths)
+
+        for shard_path in shard_paths:
+            doc_bin = DocBin().from_disk(shard_path)
+            examples = [
+                Example(nlp.make_doc(reference.text), reference)
+                for reference in doc_bin.get_docs(nlp.vocab)
+            ]
+            if shuffle:
+                random.shuffle(examples)
+            yield examples
+
+
+def generate_corpus_shard(
+    template_path: str, skills: list, shard_path: str, skill_repeats: int, seed: int
+) -> list:
+    """
+    generate synthetic skill sentences for part of the skill list and compile them into
+    a TrainingCorpus. runs in a worker process, so only a blank English tokenizer is loaded
+
+    :param template_path: file path of the skill sentence templates
+    :param skills: the skills assigned to this shard
+    :param shard_path: directory to write the shard's corpus to
+    :param skill_repeats: how many times each skill should appear in the generated sentences
+    :param seed: seed for this shard's random number generator
+    :return: the file paths of the written corpus files
+    """
+    sentence_templates = SentenceTemplate(template_path)
+    corpus = TrainingCorpus(shard_path)
+    corpus.build(
+        spacy.blank("en"),
+        sentence_templates.generate(skills, skill_repeats=skill_repeats, seed=seed),
+    )
+
+    return corpus.shard_paths
+
+
+def generate_corpus(
+    template_path: str,
+    skill_list: list,
+    corpus_path: str,
+    num_shards: int = None,
+    skill_repeats: int = 1,
+    seed: int = 0,
+) -> TrainingCorpus:
+    """
+    generate a synthetic skill sentence corpus with one worker process per shard. each
+    shard gets a fixed slice of the (sorted) skill list and its own seed derived from
+    seed, so the same arguments always produce the same corpus
+
+    :param template_path: file path of the skill sentence templates
+    :param skill_list: the list of skills
+    :param corpus_path: directory to write the shards and the manifest to
+    :param num_shards: number of shards/worker processes. defaults to the number of CPUs
+    :param skill_repeats: how many times each skill should appear in the generated sentences
+    :param seed: seed the shard seeds are derived from
+    :return: the merged corpus, which can be passed straight to update_entity_recognition
+    """
+    if not num_shards:
+        num_shards = multiprocessing.cpu_count()
+
+    # the skill list comes out of a set, so sort it to make the split reproducible
+    sorted_skills = sorted(skill_list)
+    seed_generator = random.Random(seed)
+    shard_args = [
+        (
+            template_path,
+            sorted_skills[shard_idx::num_shards],
+            os.path.join(corpus_path, f"worker-{shard_idx:03d}"),
+            skill_repeats,
+            seed_generator.getrandbits(32),
+        )
+        for shard_idx in range(num_shards)
+    ]
+
+    with multiprocessing.Pool(num_shards) as pool:
+        shard_paths = pool.starmap(generate_corpus_shard, shard_args)
+
+    corpus = TrainingCorpus(corpus_path)
+    with open(corpus.manifest_path, "w") as outfile:
+        json.dump(
+            {
+                "seed": seed,
+                "skill_repeats": skill_repeats,
+                "shards": [
+                    os.path.relpath(path, corpus_path)
+                    for paths in shard_paths
+                    for path in paths
+                ],
+            },
+            outfile,
+            indent=2,
+        )
+
+    return corpus
+
+
+# base pipelines the SKILL entity recognizer can be trained on top of. sm has no word vectors,
+# md has a pruned vector table and lg has the full vector table
+MODEL_TIERS = {
+    "sm": "en_core_web_sm",
+    "md": "en_core_web_md",
+    "lg": "en_core_web_lg",
+}
+
+# rule based components that can be kept in the serving pipeline next to the entity recognizer
+MATCHER_COMPONENTS = ("entity_ruler", "span_ruler")
+
+# the skill lexicon distilled from a trained pipeline (see lexicon.py) is saved inside the
+# pipeline's directory, but it isn't a spaCy component, so spaCy doesn't save it
+LEXICON_FILE_NAME = "skill_lexicon.json"
 
 
 class NLP:
@@ -369,8 +892,90 @@ class NLP:
     entity recognition component of the NLP pipe
     """
 
-    def __init__(self):
-        self.nlp = en_core_web_lg.load()
+    def __init__(self, base_model: str = "lg"):
+        """
+        :param base_model: a tier from MODEL_TIERS, the name of an installed spaCy pipeline
+            package, or the path of a pipeline saved with to_disk
+        """
+        self.base_model = MODEL_TIERS.get(base_model, base_model)
+        with instrumentation.stage("model_load", base_model=self.base_model):
+            try:
+                self.nlp = spacy.load(self.base_model)
+            except OSError as error:
+                if self.base_model not in MODEL_TIERS.values():
+                    raise
+                raise OSError(
+                    f"The {base_model} tier needs the {self.base_model} pipeline package, "
+                    f"install it with: python -m spacy download {self.base_model}"
+                ) from error
+
+    def to_disk(self, model_path: str):
+        """
+        save the (trained) pipeline so it can be loaded again with NLP(model_path)
+
+        :param model_path: directory to save the pipeline to
+        :return:
+        """
+        self.nlp.to_disk(model_path)
+        self.copy_lexicon(model_path)
+
+    def copy_lexicon(self, model_path: str):
+        """
+        copy the skill lexicon of the pipeline this was loaded from, if it has one, so the
+        lexicon keeps shipping with the pipeline wherever it's saved
+
+        :param model_path: directory the pipeline was saved to
+        :return:
+        """
+        lexicon_path = os.path.join(self.base_model, LEXICON_FILE_NAME)
+        if os.path.isfile(lexicon_path) and not os.path.samefile(
+            self.base_model, model_path
+        ):
+            shutil.copyfile(lexicon_path, os.path.join(model_path, LEXICON_FILE_NAME))
+
+    def serving_components(self, keep_matcher: bool = False) -> list:
+        """
+        the components extraction needs: the entity recognizer, the shared tok2vec if the
+        entity recognizer listens to it (the en_core_web pipelines give the entity recognizer
+        its own tok2vec) and optionally the rule based matchers
+
+        :param keep_matcher: keep entity_ruler/span_ruler components
+        :return: the names of the components to keep
+        """
+        components = ["ner"]
+        if "tok2vec" in self.nlp.pipe_names and "ner" in getattr(
+            self.nlp.get_pipe("tok2vec"), "listening_components", []
+        ):
+            components.insert(0, "tok2vec")
+        if keep_matcher:
+            components.extend(
+                name for name in self.nlp.pipe_names if name in MATCHER_COMPONENTS
+            )
+
+        return [name for name in self.nlp.pipe_names if name in components]
+
+    def save_serving_pipeline(self, model_path: str, keep_matcher: bool = False):
+        """
+        save a pipeline with only the tokenizer and the components extraction needs (see
+        serving_components), so loading it with NLP(model_path) skips the tagger, parser,
+        attribute_ruler and lemmatizer entirely
+
+        :param model_path: directory to save the pruned pipeline to
+        :param keep_matcher: keep entity_ruler/span_ruler components
+        :return:
+        """
+        serving_components = self.serving_components(keep_matcher)
+        excluded = [
+            name for name in self.nlp.pipe_names if name not in serving_components
+        ]
+
+        # the components have to be left out of the config as well as the weights, so the
+        # pipeline is saved and then loaded back without them
+        with tempfile.TemporaryDirectory() as full_model_path:
+            self.nlp.to_disk(full_model_path)
+            serving_nlp = spacy.load(full_model_path, exclude=excluded)
+        serving_nlp.to_disk(model_path)
+        self.copy_lexicon(model_path)
 
     def get_sentences(
         self,
@@ -456,13 +1061,41 @@ class NLP:
 
         return revisions
 
-    def update_entity_recognition(self, training_data: list, iterations: int = 30):
+    def evaluate(self, test_data: list) -> dict:
+        """
+        score the entity recognition component of the pipeline against annotated data
+
+        :param test_data: (text, annotations) tuples in the same format as the training data
+        :return: the precision, recall, and F1 of the entity recognizer, overall and per label
+        """
+        examples = []
+        for text, annotations in test_data:
+            try:
+                examples.append(Example.from_dict(self.nlp.make_doc(text), annotations))
+            except ValueError:
+                print(text)
+
+        scores = self.nlp.evaluate(examples)
+
+        return {
+            "ents_p": scores["ents_p"],
+            "ents_r": scores["ents_r"],
+            "ents_f": scores["ents_f"],
+            "ents_per_type": scores["ents_per_type"],
+        }
+
+    def update_entity_recognition(
+        self, training_data: list, iterations: int = 30, batch_tokens: int = None
+    ) -> dict:
         """
         update spaCy model entity recognition with Skills data gathered from the training data
 
-        :param training_data: the data to train the spaCy model with
+        :param training_data: the data to train the spaCy model with; either a list of
+            (text, annotations) tuples or a compiled TrainingCorpus
         :param iterations: how many training iterations (too high could over fit)
-        :return:
+        :param batch_tokens: if given, group examples of similar length into batches of
+            about this many (padded) tokens instead of using compounding batch sizes
+        :return: the losses of the last iteration and the training throughput
         """
         # add the "SKILL" entity to the Named Entity Recognition component of the spaCy pipeline
         named_entity_component = self.nlp.get_pipe("ner")
@@ -478,6 +1111,10 @@ class NLP:
         # training with new examples
         optimizer = self.nlp.resume_training()
 
+        losses = {}
+        examples_seen = 0
+        training_time = 0.0
+
         with self.nlp.disable_pipes(*unaffected_pipes), warnings.catch_warnings():
             warnings.filterwarnings("ignore", category=UserWarning, module="spacy")
 
@@ -486,51 +1123,282 @@ class NLP:
             # https://machinelearningmastery.com/gentle-introduction-mini-batch-gradient-descent-configure-batch-size/
             sizes = compounding(1.0, 4.0, 1.001)
 
-            # make training data into Example objects to update the Named Entity Recognition component with
+            # make training data into Example objects to update the Named Entity Recognition component with.
+            # a compiled corpus is already tokenized and aligned, so it's streamed in shard by shard
             examples = []
-            for text, annotations in training_data:
-                try:
-                    examples.append(
-                        Example.from_dict(self.nlp.make_doc(text), annotations)
-                    )
-                except ValueError:
-                    print(text)
+            if not isinstance(training_data, TrainingCorpus):
+                for text, annotations in training_data:
+                    try:
+                        examples.append(
+                            Example.from_dict(self.nlp.make_doc(text), annotations)
+                        )
+                    except ValueError:
+                        print(text)
 
             for training_iteration in range(iterations):
-                # use minibatches to avoid local minima when training the model
-                # see here for reference:
-                # https://datascience.stackexchange.com/questions/16807/why-mini-batch-size-is-better-than-one-single-batch-with-all-training-data
-                random.shuffle(examples)
-                minibatches = minibatch(examples, size=sizes)
+                if isinstance(training_data, TrainingCorpus):
+                    example_shards = training_data.read_shards(self.nlp)
+                else:
+                    random.shuffle(examples)
+                    example_shards = [examples]
                 losses = {}
 
-                for batch in minibatches:
-                    self.nlp.update(batch, sgd=optimizer, drop=0.35, losses=losses)
+                iteration_start = time.perf_counter()
+                with instrumentation.stage(
+                    "training_epoch", iteration=training_iteration + 1
+                ) as epoch_record:
+                    epoch_examples = 0
+                    for shard_examples in example_shards:
+                        # use minibatches to avoid local minima when training the model
+                        # see here for reference:
+                        # https://datascience.stackexchange.com/questions/16807/why-mini-batch-size-is-better-than-one-single-batch-with-all-training-data
+                        if batch_tokens:
+                            minibatches = bucketed_minibatch(
+                                shard_examples, max_tokens=batch_tokens
+                            )
+                        else:
+                            minibatches = minibatch(shard_examples, size=sizes)
+
+                        for batch in minibatches:
+                            self.nlp.update(
+                                batch, sgd=optimizer, drop=0.35, losses=losses
+                            )
+                            epoch_examples += len(batch)
+
+                    epoch_record["examples"] = epoch_examples
+                    epoch_record["losses"] = dict(losses)
+                examples_seen += epoch_examples
+                training_time += time.perf_counter() - iteration_start
 
                 print(f"Losses ({training_iteration + 1}/{iterations})", losses)
 
+        return {
+            "losses": losses,
+            "examples_per_second": (
+                examples_seen / training_time if training_time else 0.0
+            ),
+        }
 
-def main():
-    skill_file = SkillFile("resources/scraped_skills.txt")
-    skill_file.length_split()
 
-    sentence_templates = SentenceTemplate("skill_sentence_templates.txt")
-    test_skill_data, train_skill_data = sentence_templates.test_train_split(
-        skill_file.skills_list
+def modified_since(source_path: str, artifact_path: str) -> bool:
+    """
+    :param source_path: a file an artifact was built from
+    :param artifact_path: a file or directory built from it
+    :return: whether the source was modified after the newest file of the artifact was written
+    """
+    if os.path.isdir(artifact_path):
+        artifact_times = [
+            os.path.getmtime(os.path.join(directory, file_name))
+            for directory, _, file_names in os.walk(artifact_path)
+            for file_name in file_names
+        ]
+    else:
+        artifact_times = [os.path.getmtime(artifact_path)]
+
+    return os.path.getmtime(source_path) > max(artifact_times, default=0)
+
+
+# files saved next to a trained pipeline that record what it was trained on, so it can later
+# be updated with just the skills it hasn't seen
+TRAINED_SKILLS_FILE_NAME = "trained_skills.txt"
+REVISION_CACHE_FILE_NAME = "revision_data.jsonl"
+
+
+def save_training_record(
+    model_path: str, training_data, nlp: NLP, skill_path: str = None
+):
+    """
+    save the skills and the revision sentences a pipeline was trained on next to it
+
+    :param model_path: directory of the saved pipeline
+    :param training_data: the data the pipeline was trained with; either a list of
+        (text, annotations) tuples or a TrainingCorpus
+    :param nlp: the NLP wrapper, used to read a TrainingCorpus
+    :param skill_path: the skills file the training data was built from. its skills are
+        recorded as trained, held out ones included, so a later incremental_update only
+        trains on skills added to the file since. if not given, only the skills in the
+        training data are recorded
+    :return:
+    """
+    if isinstance(training_data, TrainingCorpus):
+        training_data = (
+            (
+                example.reference.text,
+                {
+                    "entities": [
+                        (entity.start_char, entity.end_char, entity.label_)
+                        for entity in example.reference.ents
+                    ]
+                },
+            )
+            for shard_examples in training_data.read_shards(nlp.nlp, shuffle=False)
+            for example in shard_examples
+        )
+
+    trained_skills = set()
+    with open(os.path.join(model_path, REVISION_CACHE_FILE_NAME), "w") as outfile:
+        for text, annotations in training_data:
+            entities = annotations["entities"]
+            skills = [
+                text[start:end] for start, end, label in entities if label == "SKILL"
+            ]
+            if skills:
+                trained_skills.update(skills)
+            else:
+                outfile.write(json.dumps([text, annotations]) + "\n")
+
+    if skill_path:
+        trained_skills.update(SkillFile(skill_path).skills_list)
+
+    with open(os.path.join(model_path, TRAINED_SKILLS_FILE_NAME), "w") as outfile:
+        outfile.write("\n".join(sorted(trained_skills)))
+
+
+def read_revisions(*file_paths: str):
+    """
+    stream the revision sentences out of one or more revision cache files
+
+    :param file_paths: JSON lines files of [text, annotations] revisions
+    :return: a generator of (text, annotations) tuples
+    """
+    for file_path in file_paths:
+        with open(file_path, "r") as infile:
+            for line in infile:
+                if line.strip():
+                    yield tuple(json.loads(line))
+
+
+def load_training_record(model_path: str) -> tuple:
+    """
+    :param model_path: directory of a pipeline saved with save_training_record
+    :return: the set of skills the pipeline was trained on and a generator of the revision
+        sentences it was trained on
+    """
+    with open(os.path.join(model_path, TRAINED_SKILLS_FILE_NAME), "r") as infile:
+        trained_skills = set(line.strip() for line in infile if line.strip())
+
+    return trained_skills, read_revisions(
+        os.path.join(model_path, REVISION_CACHE_FILE_NAME)
     )
 
-    revision_data = RevisionData("resources/teddy_roosevelt_autobiography.txt")
-    revision_data.import_text()
 
-    nlp = NLP()
-    revision_sentences = nlp.get_sentences(revision_data.text)
-    revision_sentences_trimmed = nlp.filter_sentences(revision_sentences)
-    revision_data.revisions = nlp.predict_entities(revision_sentences_trimmed)
+def incremental_update(
+    nlp: NLP,
+    model_path: str,
+    skill_path: str,
+    template_path: str,
+    skill_repeats: int = 3,
+    rehearsal_size: int = 500,
+    iterations: int = 10,
+    seed: int = None,
+) -> list:
+    """
+    fine-tune a saved pipeline on the skills in the skill file it hasn't been trained on yet,
+    instead of retraining it from the base pipeline on everything. sentences for a sample of
+    the already known skills and a sample of the cached revision data are mixed in so the
+    pipeline doesn't forget what it already knows. the updated pipeline and its training
+    record are saved back to model_path
+
+    :param nlp: the NLP wrapper loaded from model_path
+    :param model_path: directory of a pipeline saved with save_training_record
+    :param skill_path: file path of the (updated) skills file
+    :param template_path: file path of the skill sentence templates
+    :param skill_repeats: number of sentences generated for each new skill
+    :param rehearsal_size: maximum number of revision sentences and of known skills to rehearse
+    :param iterations: how many training iterations
+    :param seed: seed for the random number generator
+    :return: the skills that were new to the pipeline
+    """
+    rng = random.Random(seed)
+    trained_skills, revisions = load_training_record(model_path)
+    new_skills = sorted(set(SkillFile(skill_path).skills_list) - trained_skills)
+
+    if not new_skills:
+        print("No new skills to train on")
+        return new_skills
+
+    # split the rehearsal budget evenly between the labels the pipeline predicts, other
+    # than the SKILL label that the new skill sentences already cover
+    rehearsal_labels = set(nlp.nlp.get_pipe("ner").labels) - {"SKILL"}
+    rehearsal_sampler = RehearsalSampler(
+        train_quota=max(1, rehearsal_size // max(1, len(rehearsal_labels))),
+        test_quota=0,
+        seed=rng.getrandbits(32),
+    )
+    _, rehearsal_revisions = rehearsal_sampler.sample(revisions).test_train_split()
+
+    sentence_templates = SentenceTemplate(template_path)
+    known_skills = rng.sample(
+        sorted(trained_skills), k=min(rehearsal_size, len(trained_skills))
+    )
+    training_data = (
+        list(
+            sentence_templates.generate(
+                new_skills, skill_repeats=skill_repeats, seed=rng.getrandbits(32)
+            )
+        )
+        + list(sentence_templates.generate(known_skills, seed=rng.getrandbits(32)))
+        + rehearsal_revisions
+    )
+    print(f"Updating the model with {len(new_skills)} new skills")
+
+    nlp.update_entity_recognition(training_data, iterations=iterations)
+
+    nlp.to_disk(model_path)
+    with open(os.path.join(model_path, TRAINED_SKILLS_FILE_NAME), "w") as outfile:
+        outfile.write("\n".join(sorted(trained_skills.union(new_skills))))
 
-    test_revision_data, train_revision_data = revision_data.test_train_split()
+    return new_skills
+
+
+def build_data_sets(
+    nlp: NLP, skill_path: str, template_path: str, revision_path: str
+) -> tuple:
+    """
+    build the combined skill and revision test/train data from the resource files
+
+    :param nlp: the NLP wrapper used to find the entities in the revision data
+    :param skill_path: file path of a file containing skills data
+    :param template_path: file path of the skill sentence templates
+    :param revision_path: file path of the text to use as revision data
+    :return: the combined testing data and the combined training data
+    """
+    with instrumentation.stage("skill_data_generation"):
+        skill_file = SkillFile(skill_path)
+        skill_file.length_split()
+
+        sentence_templates = SentenceTemplate(template_path)
+        test_skill_data, train_skill_data = sentence_templates.test_train_split(
+            skill_file.skills_list
+        )
+
+    with instrumentation.stage("revision_building"):
+        revision_data = RevisionData(revision_path)
+        revision_data.import_text()
+
+        revision_sentences = nlp.get_sentences(revision_data.text)
+        revision_sentences_trimmed = nlp.filter_sentences(revision_sentences)
+        revision_data.revisions = nlp.predict_entities(revision_sentences_trimmed)
+
+        test_revision_data, train_revision_data = revision_data.test_train_split()
 
     combined_training_data = [
         sentence for value in train_skill_data.values() for sentence in value
     ] + train_revision_data
+    combined_testing_data = [
+        sentence for value in test_skill_data.values() for sentence in value
+    ] + test_revision_data
+
+    return combined_testing_data, combined_training_data
+
+
+def main():
+    nlp = NLP()
+    _, combined_training_data = build_data_sets(
+        nlp,
+        "resources/scraped_skills.txt",
+        "skill_sentence_templates.txt",
+        "resources/teddy_roosevelt_autobiography.txt",
+    )
 
     nlp.update_entity_recognition(combined_training_data)
@@ -0,0 +1,184 @@
+import cProfile
+import functools
+import os
+import pstats
+import sys
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+import instrumentation
+
+# functions of spaCy that run a pipeline component with the component's name in a local
+# variable, so samples can be attributed to components even though they're compiled
+SPACY_COMPONENT_FRAMES = {("spacy.language", "__call__"), ("spacy.util", "_pipe")}
+
+
+def frame_label(frame) -> str:
+    """
+    :param frame: a Python stack frame
+    :return: a short, flamegraph friendly name for the frame's function
+    """
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", os.path.basename(code.co_filename))
+    label = f"{module}:{code.co_name}"
+
+    if (module, code.co_name) in SPACY_COMPONENT_FRAMES:
+        component_name = frame.f_locals.get("name")
+        if isinstance(component_name, str):
+            label += f" [{component_name}]"
+
+    return label.replace(";", ":")
+
+
+class SamplingProfiler:
+    """
+    periodically samples the stack of the thread that started it from a background thread.
+    each sample is prefixed with the instrumentation stages that were running, so the
+    profile is broken down by pipeline stage
+    """
+
+    def __init__(self, interval: float = 0.005):
+        """
+        :param interval: seconds between samples
+        """
+        self.__interval = interval
+        self.__samples = Counter()
+        self.__thread_id = None
+        self.__stop_event = threading.Event()
+        self.__sampler = None
+
+    @property
+    def samples(self):
+        return self.__samples
+
+    def start(self):
+        self.__thread_id = threading.get_ident()
+        self.__stop_event.clear()
+        self.__sampler = threading.Thread(target=self.sample, daemon=True)
+        self.__sampler.start()
+
+    def stop(self):
+        self.__stop_event.set()
+        self.__sampler.join()
+
+    def sample(self):
+        while not self.__stop_event.wait(self.__interval):
+            frame = sys._current_frames().get(self.__thread_id)
+            if frame is None:
+                continue
+
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame))
+                frame = frame.f_back
+            stack.reverse()
+
+            stages = [
+                f"stage:{stage}"
+                for stage in instrumentation.active_stages(self.__thread_id)
+            ]
+            self.__samples[";".join(stages + stack)] += 1
+
+    def write_folded(self, file_path: str):
+        """
+        write the samples as folded stacks, the input format of flamegraph.pl, speedscope
+        and inferno
+
+        :param file_path: the file to write to
+        """
+        with open(file_path, "w") as outfile:
+            for stack, count in self.__samples.most_common():
+                outfile.write(f"{stack} {count}\n")
+
+    def top_functions(self, top_n: int = 25) -> list:
+        """
+        :param top_n: the number of functions to return
+        :return: (function, self samples, total samples) tuples of the functions that were
+            on top of the stack most often
+        """
+        self_samples = Counter()
+        total_samples = Counter()
+        for stack, count in self.__samples.items():
+            frames = [
+                frame for frame in stack.split(";") if not frame.startswith("stage:")
+            ]
+            if not frames:
+                continue
+            self_samples[frames[-1]] += count
+            for function in set(frames):
+                total_samples[function] += count
+
+        return [
+            (function, count, total_samples[function])
+            for function, count in self_samples.most_common(top_n)
+        ]
+
+
+@contextmanager
+def profile_run(
+    output_prefix: str,
+    mode: str = "sampling",
+    interval: float = 0.005,
+    top_n: int = 25,
+):
+    """
+    profile the code run inside the context and write the results next to output_prefix.
+    sampling mode writes {output_prefix}.folded (flamegraph input) and deterministic mode
+    writes {output_prefix}.prof (pstats, can be opened with snakeviz or flameprof). both
+    write a top-N hot function summary to {output_prefix}_top.txt
+
+    :param output_prefix: path prefix of the output files
+    :param mode: "sampling" or "deterministic" (cProfile)
+    :param interval: seconds between samples in sampling mode
+    :param top_n: number of functions in the hot function summary
+    :return:
+    """
+    if mode == "sampling":
+        profiler = SamplingProfiler(interval)
+    elif mode == "deterministic":
+        profiler = cProfile.Profile()
+    else:
+        raise ValueError(f"Unknown profile mode {mode}")
+
+    if mode == "sampling":
+        profiler.start()
+    else:
+        profiler.enable()
+
+    try:
+        yield profiler
+    finally:
+        summary_path = f"{output_prefix}_top.txt"
+        if mode == "sampling":
+            profiler.stop()
+            profiler.write_folded(f"{output_prefix}.folded")
+            with open(summary_path, "w") as outfile:
+                outfile.write(f"{'self':>8} {'total':>8}  function (samples)\n")
+                for function, self_count, total_count in profiler.top_functions(top_n):
+                    outfile.write(f"{self_count:>8} {total_count:>8}  {function}\n")
+        else:
+            profiler.disable()
+            profiler.dump_stats(f"{output_prefix}.prof")
+            with open(summary_path, "w") as outfile:
+                stats = pstats.Stats(profiler, stream=outfile)
+                stats.sort_stats(pstats.SortKey.TIME).print_stats(top_n)
+
+        print(f"Profile written to {output_prefix}.* (summary in {summary_path})")
+
+
+def profiled(func):
+    """
+    decorator for typer entry points that have profile, profile_output and profile_mode
+    options. runs the entry point under profile_run when the profile option is set
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not kwargs.get("profile"):
+            return func(*args, **kwargs)
+
+        with profile_run(kwargs["profile_output"], kwargs["profile_mode"]):
+            return func(*args, **kwargs)
+
+    return wrapper
@@ -1,46 +1,175 @@
+import itertools
 import random
 import re
-from typing import Tuple
-
-
-def make_prompt_sentence(
-    skill_list: list, start_string: str, end_string: str = "", num_choices: int = 3
-) -> Tuple[str, int]:
-    """
-    write a string about skills the user is experienced in
-
-    :param skill_list: a list of skill strings to randomly select skills from
-    :param num_choices: the number of skills that should be randomly sampled from the
-        skills list
-    :param start_string: the string to start the sentence with
-    :param end_string: the string to end the sentence with
-    :return: a string summarizing random skills and an int with suggested number of
-        skills to use in the next sentence
-    """
-    if num_choices > len(set(skill_list)):
-        num_choices = len(set(skill_list))
-
-    # de-duplicate. random.sample will be deprecated for set so use a list
-    formatted_skill_list = [
-        re.sub(r"[^a-z0-9^+# ]", "", skill, flags=re.IGNORECASE)
-        for skill in skill_list
-        if re.sub(r"[^a-z0-9^+# ]", "", skill, flags=re.IGNORECASE)
-    ]
-    random_skills = random.sample(list(set(formatted_skill_list)), k=num_choices)
-
-    output_string = start_string
-    for formatted_skill in random_skills[:-1]:
-        output_string += f"{formatted_skill}"
-        if len(random_skills) > 2:
-            output_string += ", "
-        else:
-            output_string += " "
-
-    output_string += f"and {random_skills[-1]}"
-
-    if end_string:
-        output_string += end_string
-    else:
-        output_string += "."
-
-    return output_string, num_choices - 1
+
+# characters kept in a skill when it's written into a prompt
+SKILL_CHARACTER_PATTERN = re.compile(r"[^a-z0-9^+# ]", flags=re.IGNORECASE)
+
+PROMPT_HEADER = (
+    "# USE THE FOLLOWING AUTOGENERATED PROMPT AS A SUBMISSION TO GPT-3 OR CHATGPT TO GET YOUR "
+    "COVER LETTER\n"
+)
+
+# the sentences of a prompt. {skills} is filled with a list of skills, e.g. "a, b, and c"
+SKILLS_TEMPLATE = "I am experienced in {skills}."
+MOTIVATION_TEMPLATE = (
+    "I am excited about this role because it will let me leverage my abilities in "
+    "{skills} to create impactful solutions."
+)
+PASSION_TEMPLATE = "I am passionate about solving problems at the intersection of {field} and social good."
+IMPERATIVE_TEMPLATE = (
+    "Write a cover letter to {recipient} from {user_name} for a {role_name} job at "
+    "{company_name}."
+)
+
+
+def normalize_skills(skill_list) -> tuple:
+    """
+    strip the characters that shouldn't end up in a prompt from the skills and drop the
+    repeats, ignoring case and keeping the order and spelling the skills were first found in
+
+    :param skill_list: the skills found in a resume
+    :return: the unique, cleaned up skills
+    """
+    unique_skills = {}
+    for skill in skill_list:
+        formatted_skill = SKILL_CHARACTER_PATTERN.sub("", skill)
+        if formatted_skill:
+            unique_skills.setdefault(formatted_skill.casefold(), formatted_skill)
+
+    return tuple(unique_skills.values())
+
+
+def join_skills(skills: list) -> str:
+    """
+    :param skills: the skills to list
+    :return: "a", "a and b" or "a, b, and c"
+    """
+    if len(skills) <= 2:
+        return " and ".join(skills)
+    return f"{', '.join(skills[:-1])}, and {skills[-1]}"
+
+
+class PromptEngine:
+    """
+    renders cover letter prompts. the sentence templates are bound once, each resume's
+    skills are normalized once however many prompts are rendered for it, and all the
+    random choices come from one seeded generator, so the same inputs and seed always give
+    the same prompts
+    """
+
+    def __init__(self, num_skills: int = 3, seed: int = None):
+        """
+        :param num_skills: number of skills in the first skill sentence. the second has one less
+        :param seed: seed for the random number generator
+        """
+        self.__num_skills = num_skills
+        self.__rng = random.Random(seed)
+        self.__skills_sentence = SKILLS_TEMPLATE.format
+        self.__motivation_sentence = MOTIVATION_TEMPLATE.format
+        self.__passion_sentence = PASSION_TEMPLATE.format
+        self.__imperative_sentence = IMPERATIVE_TEMPLATE.format
+
+    def render(
+        self,
+        skills: tuple,
+        user_name: str,
+        company_name: str,
+        role_name: str,
+        fields: tuple,
+        recipient_role: str = "",
+    ) -> str:
+        """
+        :param skills: the resume's skills, normalized with normalize_skills
+        :param user_name: the name of the person the cover letter is from
+        :param company_name: company to submit the CV to
+        :param role_name: role at the company the CV is for
+        :param fields: the unique job tags of the position; one is picked as the field of
+            interest
+        :param recipient_role: role of the person at the company receiving the CV
+        :return: the prompt, with a header line explaining what to do with it
+        """
+        sample = self.__rng.sample
+        sentences = []
+        num_skills = min(self.__num_skills, len(skills))
+        if num_skills:
+            sentences.append(
+                self.__skills_sentence(skills=join_skills(sample(skills, num_skills)))
+            )
+        if num_skills > 1:
+            sentences.append(
+                self.__motivation_sentence(
+                    skills=join_skills(sample(skills, num_skills - 1))
+                )
+            )
+        if fields:
+            sentences.append(self.__passion_sentence(field=self.__rng.choice(fields)))
+
+        imperative_statement = self.__imperative_sentence(
+            recipient=recipient_role or company_name,
+            user_name=user_name,
+            role_name=role_name,
+            company_name=company_name,
+        )
+
+        return "\n".join([PROMPT_HEADER, imperative_statement, " ".join(sentences)])
+
+    def render_batch(self, resumes: list, jobs: list, pairs=None):
+        """
+        render the prompts for many resumes and jobs in one call
+
+        :param resumes: (user_name, skill_list) tuples
+        :param jobs: (company_name, role_name, job_query, recipient_role) tuples
+        :param pairs: (resume index, job index) tuples of the prompts to render. every
+            resume is paired with every job if not given
+        :return: a generator of (resume index, job index, prompt) tuples
+        """
+        prepared_resumes = [
+            (user_name, normalize_skills(skill_list))
+            for user_name, skill_list in resumes
+        ]
+        prepared_jobs = [
+            (company_name, role_name, tuple(dict.fromkeys(job_query)), recipient_role)
+            for company_name, role_name, job_query, recipient_role in jobs
+        ]
+        if pairs is None:
+            pairs = itertools.product(range(len(resumes)), range(len(jobs)))
+
+        render = self.render
+        for resume_idx, job_idx in pairs:
+            user_name, skills = prepared_resumes[resume_idx]
+            company_name, role_name, fields, recipient_role = prepared_jobs[job_idx]
+            yield resume_idx, job_idx, render(
+                skills, user_name, company_name, role_name, fields, recipient_role
+            )
+
+
+def make_cover_letter_prompt(
+    skill_list: list,
+    user_name: str,
+    company_name: str,
+    role_name: str,
+    job_query: list,
+    recipient_role: str = "",
+    seed: int = None,
+) -> str:
+    """
+    write the full prompt to submit to GPT-3 or ChatGPT to get a cover letter
+
+    :param skill_list: the skills found in the resume
+    :param user_name: the name of the person the cover letter is from
+    :param company_name: company to submit the CV to
+    :param role_name: role at the company the CV is for
+    :param job_query: job tags applicable to the position; one is picked as the field of interest
+    :param recipient_role: role of the person at the company receiving the CV
+    :param seed: seed for the random number generator
+    :return: the prompt, with a header line explaining what to do with it
+    """
+    return PromptEngine(seed=seed).render(
+        normalize_skills(skill_list),
+        user_name,
+        company_name,
+        role_name,
+        tuple(dict.fromkeys(job_query)),
+        recipient_role,
+    )
@@ -0,0 +1,200 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import typer
+
+import instrumentation
+import model
+
+app = typer.Typer()
+
+# the domain requests without a (registered) domain are served with
+DEFAULT_DOMAIN = "default"
+
+
+def domain_key(domain) -> str:
+    """
+    :param domain: a domain name or a list of job query terms
+    :return: the domain in a canonical form, so the same job query terms in a different
+        order or case map to the same model
+    """
+    terms = [domain] if isinstance(domain, str) else list(domain)
+    return "+".join(sorted({" ".join(term.lower().split()) for term in terms} - {""}))
+
+
+def model_size_bytes(model_path: str) -> int:
+    """
+    the size of a saved pipeline on disk, which is close to what it takes up in memory once
+    loaded since most of a pipeline is its weights and vectors
+
+    :param model_path: directory of a saved pipeline
+    :return: the total size of the files in the directory
+    """
+    return sum(
+        os.path.getsize(os.path.join(directory, file_name))
+        for directory, _, file_names in os.walk(model_path)
+        for file_name in file_names
+    )
+
+
+class ModelRegistry:
+    """
+    a JSON file mapping domains (e.g. the job query a model was trained for) to the saved
+    pipeline trained for them
+    """
+
+    def __init__(self, file_path: str):
+        self.__file_path = file_path
+        try:
+            with open(file_path, "r") as infile:
+                self.__models = json.load(infile)
+        except FileNotFoundError:
+            self.__models = {}
+
+    @property
+    def models(self):
+        return dict(self.__models)
+
+    def register(self, domain, model_path: str):
+        """
+        :param domain: a domain name or a list of job query terms
+        :param model_path: directory of the pipeline trained for the domain
+        :return:
+        """
+        self.__models[domain_key(domain)] = model_path
+        with open(self.__file_path, "w") as outfile:
+            json.dump(self.__models, outfile, indent=2, sort_keys=True)
+
+    def resolve(self, domain, default: str = None) -> str:
+        """
+        :param domain: a domain name or a list of job query terms
+        :param default: returned if the domain isn't registered, e.g. a pipeline the caller
+            asked for explicitly
+        :return: the pipeline for the domain, falling back to default and then to the default
+            domain's pipeline
+        """
+        if domain:
+            model_path = self.__models.get(domain_key(domain))
+            if model_path:
+                return model_path
+
+        return default or self.__models.get(DEFAULT_DOMAIN)
+
+
+class ModelCache:
+    """
+    keeps the most recently used domain models loaded, up to a memory budget, and loads
+    the others on demand. the least recently used models are dropped first, but the model
+    that was just asked for is always kept even if it's larger than the budget on its own
+    """
+
+    def __init__(self, registry: ModelRegistry, max_bytes: int, max_models: int = None):
+        """
+        :param registry: the registry the domain models are looked up in
+        :param max_bytes: memory budget for the loaded models, measured as their size on disk
+        :param max_models: maximum number of loaded models, regardless of their size
+        """
+        self.__registry = registry
+        self.__max_bytes = max_bytes
+        self.__max_models = max_models
+        # model path -> (NLP, size in bytes), least recently used first. keyed by path so
+        # domains sharing a model only load it once
+        self.__models = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    @property
+    def resident_bytes(self):
+        return sum(size for _, size in self.__models.values())
+
+    def get(self, domain) -> model.NLP:
+        """
+        :param domain: a domain name or a list of job query terms
+        :return: the loaded model for the domain
+        """
+        model_path = self.__registry.resolve(domain)
+        if model_path is None:
+            raise KeyError(f"No model registered for {domain_key(domain)!r}")
+
+        with self.__lock:
+            if model_path in self.__models:
+                self.__models.move_to_end(model_path)
+                self.__stats["hits"] += 1
+                return self.__models[model_path][0]
+
+            self.__stats["misses"] += 1
+            size = model_size_bytes(model_path)
+            self.evict(size)
+            with instrumentation.stage("model_cache_load", domain=domain_key(domain)):
+                nlp = model.NLP(model_path)
+            self.__models[model_path] = (nlp, size)
+
+            return nlp
+
+    def evict(self, incoming_bytes: int):
+        """
+        drop least recently used models until a model of incoming_bytes fits in the budget
+
+        :param incoming_bytes: size of the model about to be loaded
+        :return:
+        """
+        while self.__models and (
+            self.resident_bytes + incoming_bytes > self.__max_bytes
+            or (self.__max_models and len(self.__models) >= self.__max_models)
+        ):
+            self.__models.popitem(last=False)
+            self.__stats["evictions"] += 1
+
+    def stats(self) -> dict:
+        """
+        :return: cache hits, misses and evictions, and the models currently loaded
+        """
+        with self.__lock:
+            return {
+                **self.__stats,
+                "resident_models": list(self.__models),
+                "resident_bytes": self.resident_bytes,
+            }
+
+
+@app.command()
+def register(
+    domain: str = typer.Argument(
+        ..., help="domain to register the model for, e.g. a job query term"
+    ),
+    model_path: str = typer.Argument(..., help="saved pipeline trained for the domain"),
+    registry_path: str = typer.Option(
+        "resources/model_registry.json", help="registry file"
+    ),
+):
+    """
+    register a trained pipeline for a domain
+    """
+    if not os.path.isdir(model_path):
+        raise FileNotFoundError(f"No saved pipeline at {model_path}")
+
+    ModelRegistry(registry_path).register(domain, model_path)
+
+
+@app.command(name="list")
+def list_models(
+    registry_path: str = typer.Option(
+        "resources/model_registry.json", help="registry file"
+    ),
+):
+    """
+    list the registered domains and the size of their pipelines
+    """
+    for domain, model_path in sorted(ModelRegistry(registry_path).models.items()):
+        if os.path.isdir(model_path):
+            print(
+                f"{domain}: {model_path} ({model_size_bytes(model_path) / 2 ** 20:.0f}MB)"
+            )
+        else:
+            print(f"{domain}: {model_path} (missing)")
+
+
+if __name__ == "__main__":
+    app()
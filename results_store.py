@@ -0,0 +1,253 @@
+import datetime
+import hashlib
+import os
+import threading
+import time
+import uuid
+
+import pandas
+import typer
+
+import model
+
+app = typer.Typer()
+
+RESULTS_STORE_PATH = "resources/extraction_results/"
+
+
+def resume_hash(resume_text: str) -> str:
+    """
+    :param resume_text: the parsed text of a resume
+    :return: a hash identifying the resume, so the same resume processed twice can be told apart
+        from two different resumes
+    """
+    return hashlib.sha256(resume_text.encode()).hexdigest()
+
+
+def model_version(nlp: model.NLP) -> str:
+    """
+    identify the weights a pipeline extracted with. saved pipelines keep the name and version
+    of the pipeline they were trained from, so a hash of the entity recognizer's weights is
+    added to tell retrained pipelines apart
+
+    :param nlp: the NLP wrapper
+    :return: <pipeline name>-<pipeline version>-<entity recognizer hash>
+    """
+    ner_hash = hashlib.sha256(nlp.nlp.get_pipe("ner").to_bytes()).hexdigest()[:12]
+    return f"{nlp.nlp.meta['lang']}_{nlp.nlp.meta['name']}-{nlp.nlp.meta['version']}-{ner_hash}"
+
+
+class ResultsStore:
+    """
+    an append only Parquet store of extraction results, one row per processed resume,
+    partitioned by date (<root>/date=YYYY-MM-DD/). rows are buffered and every flush writes
+    a new file into the partition, so runs never rewrite earlier results and the whole
+    store can be read back as one table
+    """
+
+    def __init__(self, root: str = RESULTS_STORE_PATH, flush_size: int = 1000):
+        """
+        :param root: directory of the store
+        :param flush_size: number of buffered rows that triggers a flush
+        """
+        self.__root = root
+        self.__flush_size = flush_size
+        self.__rows = []
+        self.__lock = threading.Lock()
+
+    @property
+    def root(self):
+        return self.__root
+
+    def add(
+        self,
+        resume_text: str,
+        entities: list,
+        model_version: str,
+        source: str = "",
+        company_name: str = "",
+        role_name: str = "",
+        job_query: list = (),
+        parse_seconds: float = None,
+        extraction_seconds: float = None,
+    ):
+        """
+        buffer the results of one resume
+
+        :param resume_text: the parsed text of the resume
+        :param entities: the entities extracted from the resume
+        :param model_version: the version of the pipeline that extracted the entities
+        :param source: file the resume was read from
+        :param company_name: company the CV is for
+        :param role_name: role the CV is for
+        :param job_query: job tags applicable to the position
+        :param parse_seconds: time taken to parse the resume
+        :param extraction_seconds: time taken to extract the entities
+        :return:
+        """
+        extracted_at = datetime.datetime.now(datetime.timezone.utc)
+        row = {
+            "resume_hash": resume_hash(resume_text),
+            "extracted_at": extracted_at,
+            "date": extracted_at.date().isoformat(),
+            "source": os.path.basename(source),
+            "company_name": company_name,
+            "role_name": role_name,
+            "job_query": list(job_query),
+            "model_version": model_version,
+            "skills": [entity.text for entity in entities if entity.label == "SKILL"],
+            "entity_start_chars": [entity.start_char for entity in entities],
+            "entity_end_chars": [entity.end_char for entity in entities],
+            "entity_labels": [entity.label for entity in entities],
+            "entity_texts": [entity.text for entity in entities],
+            "parse_seconds": parse_seconds,
+            "extraction_seconds": extraction_seconds,
+        }
+
+        with self.__lock:
+            self.__rows.append(row)
+            if len(self.__rows) < self.__flush_size:
+                return
+            rows, self.__rows = self.__rows, []
+
+        self.write(rows)
+
+    def flush(self):
+        with self.__lock:
+            rows, self.__rows = self.__rows, []
+        self.write(rows)
+
+    def write(self, rows: list):
+        """
+        write rows to a new file in each of their date partitions
+
+        :param rows: the rows to write
+        :return:
+        """
+        if not rows:
+            return
+
+        results = pandas.DataFrame(rows)
+        for date, partition in results.groupby("date"):
+            partition_path = os.path.join(self.__root, f"date={date}")
+            os.makedirs(partition_path, exist_ok=True)
+            partition.drop(columns="date").to_parquet(
+                os.path.join(
+                    partition_path,
+                    f"part-{time.time_ns()}-{uuid.uuid4().hex[:8]}.parquet",
+                ),
+                index=False,
+            )
+
+    def read(self, columns: list = None, since: str = None) -> pandas.DataFrame:
+        """
+        :param columns: columns to read. only these are read from disk
+        :param since: only read the partitions from this date (YYYY-MM-DD) on
+        :return: the stored results
+        """
+        return pandas.read_parquet(
+            self.__root,
+            columns=columns,
+            filters=[("date", ">=", since)] if since else None,
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+
+def skill_frequency_by_role(
+    results: pandas.DataFrame, top_n: int = 20
+) -> pandas.DataFrame:
+    """
+    :param results: results with role_name, resume_hash and skills columns
+    :param top_n: number of skills to keep per role
+    :return: the number of distinct resumes each skill was found in, per role
+    """
+    skills = (
+        results.drop_duplicates(["role_name", "resume_hash"])
+        .explode("skills")
+        .dropna(subset=["skills"])
+    )
+    counts = (
+        skills.groupby(["role_name", "skills"])
+        .size()
+        .rename("resumes")
+        .reset_index()
+        .sort_values(["role_name", "resumes"], ascending=[True, False])
+    )
+
+    return counts.groupby("role_name").head(top_n)
+
+
+def model_drift(results: pandas.DataFrame) -> pandas.DataFrame:
+    """
+    compare what each model version extracts: how many skills it finds per resume, how
+    fast it is, and how much the skills it found overlap (Jaccard) with the skills the
+    previous version found
+
+    :param results: results with model_version, extracted_at, skills and extraction_seconds
+        columns
+    :return: one row per model version, in the order the versions were first used
+    """
+    first_used = results.groupby("model_version")["extracted_at"].min().sort_values()
+    versions = pandas.DataFrame(
+        {
+            "first_used": first_used,
+            "resumes": results.groupby("model_version").size(),
+            "mean_skills": results.groupby("model_version")["skills"].apply(
+                lambda skills: skills.map(len).mean()
+            ),
+            "mean_extraction_seconds": results.groupby("model_version")[
+                "extraction_seconds"
+            ].mean(),
+        }
+    ).loc[first_used.index]
+
+    skill_sets = results.groupby("model_version")["skills"].apply(
+        lambda skills: set(skill for resume_skills in skills for skill in resume_skills)
+    )
+    overlaps = [None]
+    for previous_version, version in zip(first_used.index, first_used.index[1:]):
+        union = skill_sets[previous_version] | skill_sets[version]
+        overlaps.append(
+            len(skill_sets[previous_version] & skill_sets[version]) / len(union)
+            if union
+            else None
+        )
+    versions["skill_overlap_with_previous"] = overlaps
+
+    return versions
+
+
+@app.command()
+def report(
+    store_path: str = typer.Option(RESULTS_STORE_PATH, help="results store directory"),
+    since: str = typer.Option(
+        None, help="only include results from this date (YYYY-MM-DD) on"
+    ),
+    top_n: int = typer.Option(20, help="number of skills to show per role"),
+):
+    """
+    print the most frequent skills per role and how the model versions compare
+    """
+    results = ResultsStore(store_path).read(
+        columns=[
+            "resume_hash",
+            "extracted_at",
+            "role_name",
+            "model_version",
+            "skills",
+            "extraction_seconds",
+        ],
+        since=since,
+    )
+    print(f"{len(results)} results")
+    print(skill_frequency_by_role(results, top_n).to_string(index=False))
+    print(model_drift(results).to_string())
+
+
+if __name__ == "__main__":
+    app()
@@ -1,14 +1,16 @@
 import os
 import re
+import zipfile
 
 from enum import Enum
-from typing import Optional
-
-import docx
+from typing import Iterator, Optional
+from xml.etree import ElementTree
 
 from charset_normalizer import from_bytes
 from tika import parser
 
+import instrumentation
+
 os.environ["TIKA_CLIENT_ONLY"] = "False"
 os.environ["TIKA_LOG_PATH"] = "resources/tika/logs/"
 os.environ["TIKA_SERVER_ENDPOINT"] = "localhost"
@@ -16,6 +18,9 @@ os.environ["TIKA_SERVER_JAR"] = "file:////tika-server.jar"
 os.environ["TIKA_VERSION"] = "1.24"
 
 
+WORD_NAMESPACE = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
 class FileType(Enum):
     DOC = "doc"
     DOCX = "docx"
@@ -39,18 +44,82 @@ def get_file_type(file_path: str) -> FileType:
     :param file_path: file path to resume
     :return: a FileType object corresponding to the resume's file format
     """
-    if re.search(r".doc$", file_path):
+    if re.search(r"\.doc$", file_path):
         return FileType.DOC
-    elif re.search(r".docx$", file_path):
+    elif re.search(r"\.docx$", file_path):
         return FileType.DOCX
-    elif re.search(r".pdf$", file_path):
+    elif re.search(r"\.pdf$", file_path):
         return FileType.PDF
-    elif re.search(r".txt$", file_path):
+    elif re.search(r"\.txt$", file_path):
         return FileType.TXT
     else:
         return FileType.UNSUPPORTED
 
 
+def iter_docx_lines(file_path: str) -> Iterator[str]:
+    """Stream the text of a DOCX file line by line without building the whole document model
+
+    Paragraphs are yielded one per line, list paragraphs are prefixed with a bullet, and each
+    table row is yielded as one line with its cells separated by tabs
+
+    :param file_path: file path to the DOCX file
+    :return: a generator of lines of text
+    """
+    # text parts and list item flag of each open paragraph. a paragraph can hold another
+    # one, e.g. in a textbox, which has to be finished without losing the outer one's text
+    paragraphs = []
+    row_cells = []
+    cell_paragraphs = []
+    table_depth = 0
+
+    with zipfile.ZipFile(file_path) as docx_file:
+        with docx_file.open("word/document.xml") as document_xml:
+            for event, element in ElementTree.iterparse(
+                document_xml, events=("start", "end")
+            ):
+                tag = element.tag
+
+                if event == "start":
+                    if tag == WORD_NAMESPACE + "tbl":
+                        table_depth += 1
+                    elif tag == WORD_NAMESPACE + "p":
+                        paragraphs.append({"parts": [], "is_list_item": False})
+                    continue
+
+                if tag == WORD_NAMESPACE + "t":
+                    paragraphs[-1]["parts"].append(element.text or "")
+                elif tag == WORD_NAMESPACE + "tab":
+                    paragraphs[-1]["parts"].append("\t")
+                elif tag in (WORD_NAMESPACE + "br", WORD_NAMESPACE + "cr"):
+                    paragraphs[-1]["parts"].append("\n")
+                elif tag == WORD_NAMESPACE + "numPr":
+                    paragraphs[-1]["is_list_item"] = True
+
+                elif tag == WORD_NAMESPACE + "p":
+                    paragraph = paragraphs.pop()
+                    paragraph_text = "".join(paragraph["parts"])
+                    if paragraph["is_list_item"] and paragraph_text:
+                        paragraph_text = "• " + paragraph_text
+
+                    if table_depth:
+                        cell_paragraphs.append(paragraph_text)
+                    else:
+                        yield paragraph_text
+                    # free the paragraph once its text has been taken out
+                    element.clear()
+
+                elif tag == WORD_NAMESPACE + "tc":
+                    row_cells.append(" ".join(text for text in cell_paragraphs if text))
+                    cell_paragraphs = []
+                elif tag == WORD_NAMESPACE + "tr":
+                    yield "\t".join(row_cells)
+                    row_cells = []
+                    element.clear()
+                elif tag == WORD_NAMESPACE + "tbl":
+                    table_depth -= 1
+                    element.clear()
+
+
 def resume_parser(file_path: str) -> Optional[str]:
     """Get the raw text of the input resume
 
@@ -61,22 +130,23 @@ def resume_parser(file_path: str) -> Optional[str]:
     # detect the file type based on the extension
     file_type = get_file_type(file_path)
 
-    # parse word doc files
-    if file_type is FileType.DOC or file_type is FileType.DOCX:
-        word_doc = docx.Document(file_path)
-        return "\n".join([paragraph.text for paragraph in word_doc.paragraphs])
-
-    # parse pdf files
-    elif file_type is FileType.PDF:
-        parsed = parser.from_file(file_path)
-        return parsed["content"]
-
-    # parse txt files
-    elif file_type is FileType.TXT:
-        with open(file_path, "rb") as infile:
-            byte_text = infile.read()
-        return decode_text(byte_text)
-
-    # return None if file type isn't supported
-    elif file_type is FileType.UNSUPPORTED:
-        return None
+    with instrumentation.stage("resume_parse", file_type=file_type.value):
+        # parse word docx files
+        if file_type is FileType.DOCX:
+            return "\n".join(iter_docx_lines(file_path))
+
+        # parse pdf files and legacy (binary) word doc files
+        elif file_type is FileType.PDF or file_type is FileType.DOC:
+            with instrumentation.stage("tika_round_trip"):
+                parsed = parser.from_file(file_path)
+            return parsed["content"]
+
+        # parse txt files
+        elif file_type is FileType.TXT:
+            with open(file_path, "rb") as infile:
+                byte_text = infile.read()
+            return decode_text(byte_text)
+
+        # return None if file type isn't supported
+        elif file_type is FileType.UNSUPPORTED:
+            return None
@@ -0,0 +1,318 @@
+import asyncio
+import json
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import typer
+
+import extraction
+import lexicon
+import model
+import registry
+import synthetic
+
+app = typer.Typer()
+
+
+class MicroBatcher:
+    """
+    an asyncio front end for entity extraction. requests are put on a queue and collected
+    into batches of up to max_batch_size requests, waiting at most max_wait_ms for a batch
+    to fill up, and each batch is run through the model with a single nlp.pipe call.
+    larger batches and longer waits trade latency for throughput. with a model cache,
+    requests can name a domain and are run through that domain's model, with a batch
+    split into one nlp.pipe call per domain
+    """
+
+    def __init__(
+        self,
+        nlp: model.NLP,
+        max_batch_size: int = 32,
+        max_wait_ms: float = 10.0,
+        labels: tuple = ("SKILL", "PERSON"),
+        models: registry.ModelCache = None,
+        lexicon_screen: bool = False,
+    ):
+        """
+        :param nlp: the NLP wrapper with the trained SKILL entity recognizer, used for
+            requests without a domain
+        :param max_batch_size: maximum number of requests in a batch
+        :param max_wait_ms: how long to wait for more requests after the first request of a
+            batch arrives
+        :param labels: the entity labels to return
+        :param models: the domain models, for requests that name a domain
+        :param lexicon_screen: screen every text with the skill lexicon of the pipeline it's
+            run through. texts without a known skill get no SKILL entities, and skip the model
+            if SKILL is the only label asked for
+        """
+        self.__nlp = nlp
+        self.__models = models
+        self.__max_batch_size = max_batch_size
+        self.__max_wait = max_wait_ms / 1000
+        self.__labels = labels
+        self.__lexicon_screen = lexicon_screen
+        # model path -> the lexicon distilled into it, loaded the first time it's needed
+        self.__lexicons = {}
+        self.__queue = None
+        self.__worker = None
+        # spaCy pipelines aren't thread safe, so batches run one at a time off the event loop
+        self.__executor = ThreadPoolExecutor(max_workers=1)
+        self.__latencies = []
+        self.__batch_sizes = []
+        self.__started_at = None
+
+    async def start(self):
+        self.__queue = asyncio.Queue()
+        self.__worker = asyncio.create_task(self.run())
+        self.__started_at = time.perf_counter()
+
+    async def stop(self):
+        self.__worker.cancel()
+        try:
+            await self.__worker
+        except asyncio.CancelledError:
+            pass
+        self.__executor.shutdown()
+
+    async def extract(self, text: str, domain: str = None) -> list:
+        """
+        :param text: the resume text
+        :param domain: the domain whose model should be used. requires a model cache
+        :return: the entities found in the resume
+        """
+        # checked before queueing so a bad request fails on its own instead of failing the
+        # whole batch it would have been run with
+        if not isinstance(text, str):
+            raise TypeError(f"text must be a string, not {type(text).__name__}")
+
+        future = asyncio.get_running_loop().create_future()
+        await self.__queue.put((text, domain, future, time.perf_counter()))
+        return await future
+
+    def process(self, texts: list, domain: str = None) -> list:
+        nlp = self.__models.get(domain) if domain and self.__models else self.__nlp
+        skill_lexicon = None
+        if self.__lexicon_screen:
+            if nlp.base_model not in self.__lexicons:
+                self.__lexicons[nlp.base_model] = lexicon.SkillLexicon.from_model(
+                    nlp.base_model
+                )
+            skill_lexicon = self.__lexicons[nlp.base_model]
+
+        with nlp.nlp.select_pipes(enable=nlp.serving_components()):
+            return extraction.extract_batch(
+                nlp.nlp,
+                texts,
+                labels=self.__labels,
+                batch_size=128,
+                segment=True,
+                lexicon=skill_lexicon,
+            )
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.__queue.get()]
+            deadline = loop.time() + self.__max_wait
+            while len(batch) < self.__max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.__queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            domain_batches = {}
+            for request in batch:
+                domain_batches.setdefault(request[1], []).append(request)
+
+            self.__batch_sizes.append(len(batch))
+            for domain, domain_batch in domain_batches.items():
+                texts = [text for text, _, _, _ in domain_batch]
+                try:
+                    results = await loop.run_in_executor(
+                        self.__executor, self.process, texts, domain
+                    )
+                except Exception as error:
+                    for _, _, future, _ in domain_batch:
+                        if not future.done():
+                            future.set_exception(error)
+                    continue
+
+                finished_at = time.perf_counter()
+                for (_, _, future, queued_at), entities in zip(domain_batch, results):
+                    self.__latencies.append(finished_at - queued_at)
+                    if not future.done():
+                        future.set_result(entities)
+
+    def stats(self) -> dict:
+        """
+        :return: the number of requests and batches served, the mean batch size, the p50/p99
+            request latency and the throughput since the batcher started
+        """
+        if not self.__latencies:
+            return {"requests": 0, "batches": 0}
+
+        # quantiles needs at least two points; with fewer, the only latency is the p99
+        p99_latency = (
+            statistics.quantiles(self.__latencies, n=100)[98]
+            if len(self.__latencies) > 1
+            else max(self.__latencies)
+        )
+        stats = {
+            "requests": len(self.__latencies),
+            "batches": len(self.__batch_sizes),
+            "mean_batch_size": statistics.mean(self.__batch_sizes),
+            "p50_latency_ms": statistics.median(self.__latencies) * 1000,
+            "p99_latency_ms": p99_latency * 1000,
+            "requests_per_second": len(self.__latencies)
+            / (time.perf_counter() - self.__started_at),
+        }
+        if self.__models:
+            stats["model_cache"] = self.__models.stats()
+
+        return stats
+
+
+async def handle_connection(
+    batcher: MicroBatcher, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+):
+    """
+    serve newline delimited JSON requests, {"text": ..., "domain": ...} with an optional
+    domain, with {"entities": [...]} responses
+    """
+    while line := await reader.readline():
+        try:
+            request = json.loads(line)
+            entities = await batcher.extract(request["text"], request.get("domain"))
+            response = {"entities": [entity._asdict() for entity in entities]}
+        except (ValueError, KeyError, TypeError) as error:
+            response = {"error": str(error)}
+
+        writer.write((json.dumps(response) + "\n").encode())
+        await writer.drain()
+
+    writer.close()
+
+
+async def load_test(batcher: MicroBatcher, texts: list, concurrency: int) -> dict:
+    """
+    send every text to the batcher from concurrency simultaneous clients
+
+    :param batcher: a started MicroBatcher
+    :param texts: the resumes to send
+    :param concurrency: number of requests in flight at once
+    :return: the batcher's stats after the load test
+    """
+    pending = iter(texts)
+
+    async def client():
+        for text in pending:
+            await batcher.extract(text)
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+
+    return batcher.stats()
+
+
+@app.command()
+def serve(
+    model_path: str = typer.Argument(..., help="trained (serving) pipeline to serve"),
+    host: str = typer.Option("127.0.0.1", help="host to listen on"),
+    port: int = typer.Option(8765, help="port to listen on"),
+    max_batch_size: int = typer.Option(32, help="maximum number of requests per batch"),
+    max_wait_ms: float = typer.Option(
+        10.0, help="how long to wait for a batch to fill up, in milliseconds"
+    ),
+    registry_path: str = typer.Option(
+        "",
+        help="model registry of domain specific pipelines that requests can ask for by domain",
+    ),
+    cache_mb: int = typer.Option(
+        2048, help="memory budget for the loaded domain pipelines, in MB"
+    ),
+    lexicon_screen: bool = typer.Option(
+        False,
+        "--lexicon-screen",
+        help="take no skills from the model for texts the pipeline's skill lexicon finds no known skill in",
+    ),
+):
+    """
+    serve entity extraction over TCP with newline delimited JSON requests
+    """
+
+    async def run_server():
+        models = None
+        if registry_path:
+            models = registry.ModelCache(
+                registry.ModelRegistry(registry_path), cache_mb * 2**20
+            )
+        batcher = MicroBatcher(
+            model.NLP(model_path),
+            max_batch_size,
+            max_wait_ms,
+            models=models,
+            lexicon_screen=lexicon_screen,
+        )
+        await batcher.start()
+        server = await asyncio.start_server(
+            lambda reader, writer: handle_connection(batcher, reader, writer),
+            host,
+            port,
+        )
+        print(f"Serving entity extraction on {host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            print(batcher.stats())
+            await batcher.stop()
+
+    asyncio.run(run_server())
+
+
+@app.command()
+def load(
+    model_path: str = typer.Argument(..., help="trained (serving) pipeline to test"),
+    num_requests: int = typer.Option(512, help="number of requests to send"),
+    concurrency: int = typer.Option(64, help="number of requests in flight at once"),
+    max_batch_size: int = typer.Option(32, help="maximum number of requests per batch"),
+    max_wait_ms: float = typer.Option(
+        10.0, help="how long to wait for a batch to fill up, in milliseconds"
+    ),
+    seed: int = typer.Option(0, help="random seed for the synthetic resumes"),
+):
+    """
+    load test the micro batcher locally with synthetic resumes
+    """
+    rng = random.Random(seed)
+    sentence_templates = model.SentenceTemplate(
+        synthetic.ENV_RESOURCES + "skill_sentence_templates.txt"
+    )
+    skill_list = sorted(
+        model.SkillFile(synthetic.ENV_RESOURCES + "scraped_skills.txt").skills_list
+    )
+    texts = [
+        synthetic.synthetic_resume(rng, skill_list, sentence_templates)
+        for _ in range(num_requests)
+    ]
+
+    async def run_load_test():
+        batcher = MicroBatcher(model.NLP(model_path), max_batch_size, max_wait_ms)
+        await batcher.start()
+        try:
+            return await load_test(batcher, texts, concurrency)
+        finally:
+            await batcher.stop()
+
+    for stat, value in asyncio.run(run_load_test()).items():
+        print(
+            f"{stat}: {value:.2f}" if isinstance(value, float) else f"{stat}: {value}"
+        )
+
+
+if __name__ == "__main__":
+    app()
@@ -1,8 +1,14 @@
+import asyncio
 import json
+import os
 import random
 import re
 import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from urllib.parse import quote_plus, unquote, urljoin
 
+import requests
 import typer
 
 from parsel import Selector
@@ -15,26 +21,190 @@ from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import WebDriverWait
 
-ENV_RESOURCES = "resources/"
-
+import instrumentation
+import profiling
 
-def initialize_web_scraper() -> selenium.webdriver.chrome.webdriver.WebDriver:
+ENV_RESOURCES = "resources/"
+SEEN_PROFILES_PATH = ENV_RESOURCES + "seen_profiles.txt"
+
+
+# requests matching these patterns are never sent when resource blocking is on. the scraper
+# only reads the page source, so images, media, fonts and trackers are downloaded for nothing
+BLOCKED_URL_PATTERNS = (
+    "*.png*",
+    "*.jpg*",
+    "*.jpeg*",
+    "*.gif*",
+    "*.webp*",
+    "*.svg*",
+    "*.ico*",
+    "*.mp4*",
+    "*.webm*",
+    "*.mp3*",
+    "*.woff*",
+    "*.ttf*",
+    "*media.licdn.com*",
+    "*media-exp*.licdn.com*",
+    "*doubleclick.net*",
+    "*google-analytics.com*",
+    "*googletagmanager.com*",
+    "*googlesyndication.com*",
+    "*googleadservices.com*",
+    "*facebook.net*",
+    "*bing.com*",
+    "*ads.linkedin.com*",
+    "*px.ads.linkedin.com*",
+    "*snap.licdn.com*",
+)
+
+# named sets of initialize_web_scraper arguments. the lean profile can't be used when a human
+# has to get through bot detection, since there's no window to do it in
+BROWSER_PROFILES = {
+    "default": {},
+    "lean": {"headless": True, "block_resources": True, "page_load_strategy": "eager"},
+}
+
+# ways of fetching the profile pages once logged in
+FETCH_MODES = ("browser", "http")
+
+
+def initialize_web_scraper(
+    headless: bool = False,
+    block_resources: bool = False,
+    profile_dir: str = None,
+    page_load_strategy: str = "normal",
+    log_network: bool = False,
+) -> selenium.webdriver.chrome.webdriver.WebDriver:
     """
     Initialize an instance of the selenium webdriver
+
+    :param headless: run Chrome without a window
+    :param block_resources: don't load images, media, fonts or ad/tracking requests
+    :param profile_dir: Chrome user data directory to reuse, so login cookies survive restarts
+    :param page_load_strategy: 'normal' waits for every resource to load, 'eager' returns
+        once the DOM is ready and 'none' returns right away
+    :param log_network: keep Chrome's network log so page loads can be measured
     """
     chrome_options = webdriver.ChromeOptions()
-    chrome_options.add_argument("--start-maximized")
+    if headless:
+        chrome_options.add_argument("--headless=new")
+        chrome_options.add_argument("--window-size=1920,1080")
+    else:
+        chrome_options.add_argument("--start-maximized")
     chrome_options.add_argument("--disable-gpu")
     chrome_options.add_argument("--no-sandbox")
     chrome_options.add_argument("--disable-notifications")
     chrome_options.add_experimental_option('excludeSwitches', ['enable-logging'])
     chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
     chrome_options.add_experimental_option('useAutomationExtension', False)
+
+    if profile_dir:
+        chrome_options.add_argument(f"--user-data-dir={os.path.abspath(profile_dir)}")
+    if block_resources:
+        chrome_options.add_argument("--blink-settings=imagesEnabled=false")
+        chrome_options.add_experimental_option(
+            "prefs", {"profile.managed_default_content_settings.images": 2}
+        )
+    if log_network:
+        chrome_options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+    chrome_options.page_load_strategy = page_load_strategy
+
     driver = webdriver.Chrome(options=chrome_options)
 
+    if block_resources:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd(
+            "Network.setBlockedURLs", {"urls": list(BLOCKED_URL_PATTERNS)}
+        )
+
     return driver
 
 
+def browser_profile_options(browser_profile: str) -> dict:
+    """
+    :param browser_profile: name of one of the BROWSER_PROFILES
+    :return: the initialize_web_scraper arguments of the profile
+    """
+    if browser_profile not in BROWSER_PROFILES:
+        raise typer.BadParameter(
+            f"Unknown browser profile {browser_profile!r}, expected one of "
+            f"{', '.join(BROWSER_PROFILES)}",
+            param_hint="--browser_profile",
+        )
+
+    return BROWSER_PROFILES[browser_profile]
+
+
+def measure_page_load(
+    driver: selenium.webdriver.chrome.webdriver.WebDriver,
+    url: str,
+    idle_seconds: float = 0.5,
+    timeout: float = 30,
+) -> dict:
+    """
+    Load a page and measure how long it took and how much was downloaded. The driver
+    has to be started with log_network=True. get() returns at different points for
+    different page load strategies, so the page counts as loaded once the document is
+    complete and the network has been idle for idle_seconds, whatever the strategy
+
+    :param driver: the selenium webdriver instance
+    :param url: the page to load
+    :param idle_seconds: how long no request may be in flight for the network to count as idle
+    :param timeout: give up waiting for the network to go idle after this many seconds
+    :return: the load time in seconds, the bytes transferred and the number of requests
+        that finished and that were blocked
+    """
+    # drop whatever was logged before this page
+    driver.get_log("performance")
+
+    page_load = {
+        "load_seconds": 0.0,
+        "bytes_transferred": 0,
+        "requests": 0,
+        "blocked_requests": 0,
+    }
+    in_flight = set()
+
+    def read_log() -> bool:
+        network_activity = False
+        for entry in driver.get_log("performance"):
+            message = json.loads(entry["message"])["message"]
+            request_id = message.get("params", {}).get("requestId")
+            if message["method"] == "Network.requestWillBeSent":
+                in_flight.add(request_id)
+            elif message["method"] == "Network.loadingFinished":
+                in_flight.discard(request_id)
+                page_load["bytes_transferred"] += message["params"]["encodedDataLength"]
+                page_load["requests"] += 1
+            elif message["method"] == "Network.loadingFailed":
+                in_flight.discard(request_id)
+                if message["params"].get("blockedReason"):
+                    page_load["blocked_requests"] += 1
+            else:
+                continue
+            network_activity = True
+
+        return network_activity
+
+    start = time.perf_counter()
+    driver.get(url)
+    WebDriverWait(driver, timeout).until(
+        lambda driver: driver.execute_script("return document.readyState") == "complete"
+    )
+    loaded_at = time.perf_counter()
+
+    while time.perf_counter() - start < timeout:
+        if read_log():
+            loaded_at = time.perf_counter()
+        elif not in_flight and time.perf_counter() - loaded_at >= idle_seconds:
+            break
+        time.sleep(0.05)
+
+    page_load["load_seconds"] = loaded_at - start
+
+    return page_load
+
+
 def linkedin_login(
     driver: selenium.webdriver.chrome.webdriver.WebDriver, credentials: dict
 ):
@@ -49,6 +219,10 @@ def linkedin_login(
     # need to log in to LinkedIn since skills aren't available in the public view
     driver.get("https://www.linkedin.com/")
 
+    # a reused browser profile may still be logged in
+    if re.search(r"^https://www.linkedin.com/feed/", driver.current_url):
+        return
+
     # wait until relevant website elements are visible before trying to interact further
     try:
         WebDriverWait(driver, 10).until(
@@ -79,15 +253,137 @@ def linkedin_login(
     return
 
 
+def normalize_query(job_query: list[str]) -> list[str]:
+    """
+    Put job query terms in a canonical form, so the same search written differently (order,
+    case, spacing, repeated terms) maps to the same cached results
+
+    :param job_query: a list of strings containing the types of jobs to look for
+    :return: the unique, lower cased terms in sorted order
+    """
+    return sorted(
+        {" ".join(search_term.lower().split()) for search_term in job_query} - {""}
+    )
+
+
+def normalize_profile_url(profile_url: str) -> Optional[str]:
+    """
+    Reduce a LinkedIn profile URL to https://www.linkedin.com/in/<profile id>, so the same
+    profile under a country subdomain, with a query string or a trailing slash is only
+    kept once
+
+    :param profile_url: a LinkedIn profile URL
+    :return: the normalized URL, or None if it isn't a profile URL
+    """
+    profile_match = re.search(
+        r"linkedin\.com/in/([^/?#\s]+)", profile_url, flags=re.IGNORECASE
+    )
+    if not profile_match:
+        return None
+
+    return f"https://www.linkedin.com/in/{unquote(profile_match.group(1)).lower()}"
+
+
+class SerpCache:
+    """
+    Google search result pages already harvested, keyed by the normalized query and the
+    page number. Entries older than the TTL are searched again
+    """
+
+    def __init__(self, file_path: str, ttl: float = 7 * 24 * 3600):
+        """
+        :param file_path: JSON file the cache is kept in
+        :param ttl: seconds a cached page of results stays valid
+        """
+        self.__file_path = file_path
+        self.__ttl = ttl
+        try:
+            with open(file_path, "r") as infile:
+                self.__entries = json.load(infile)
+        except FileNotFoundError:
+            self.__entries = {}
+
+    @staticmethod
+    def key(search_query: str, page: int) -> str:
+        return f"{search_query}|{page}"
+
+    def get(self, search_query: str, page: int) -> Optional[list[str]]:
+        entry = self.__entries.get(self.key(search_query, page))
+        if entry is None or time.time() - entry["fetched_at"] > self.__ttl:
+            return None
+        return entry["urls"]
+
+    def put(self, search_query: str, page: int, urls: list[str]):
+        self.__entries[self.key(search_query, page)] = {
+            "fetched_at": time.time(),
+            "urls": urls,
+        }
+        # write through, so pages harvested before bot detection stops a run are kept
+        with open(self.__file_path, "w") as outfile:
+            json.dump(self.__entries, outfile)
+
+
+class SeenProfiles:
+    """
+    The normalized URLs of the profiles previous runs scraped, kept on disk one per line
+    """
+
+    def __init__(self, file_path: str):
+        self.__file_path = file_path
+        try:
+            with open(file_path, "r") as infile:
+                self.__seen = {line.strip() for line in infile if line.strip()}
+        except FileNotFoundError:
+            self.__seen = set()
+
+    def __contains__(self, profile_url: str) -> bool:
+        return profile_url in self.__seen
+
+    def __len__(self):
+        return len(self.__seen)
+
+    def unseen(self, profile_urls: list[str]) -> list[str]:
+        """
+        :param profile_urls: normalized profile URLs
+        :return: the URLs that haven't been seen before, in order and without repeats
+        """
+        return [
+            profile_url
+            for profile_url in dict.fromkeys(profile_urls)
+            if profile_url not in self.__seen
+        ]
+
+    def add(self, profile_urls: list[str]) -> list[str]:
+        """
+        :param profile_urls: normalized profile URLs. None (not a profile URL) is ignored
+        :return: the URLs that hadn't been seen before, in order
+        """
+        new_urls = []
+        for profile_url in profile_urls:
+            if profile_url and profile_url not in self.__seen:
+                self.__seen.add(profile_url)
+                new_urls.append(profile_url)
+
+        if new_urls:
+            with open(self.__file_path, "a+") as outfile:
+                outfile.write("".join(f"{profile_url}\n" for profile_url in new_urls))
+
+        return new_urls
+
+
 def get_user_profiles(
     driver: selenium.webdriver.chrome.webdriver.WebDriver,
     job_query: list[str],
     full_automation: bool,
     num_pages: int = 10,
+    cache_ttl: float = 7 * 24 * 3600,
 ) -> list[str]:
     """
     Use Google to get LinkedIn profiles related to a particular type of job
-    (e.g. Data Science)
+    (e.g. Data Science). Result pages are cached in resources/serp_cache.json and
+    profiles already in resources/seen_profiles.txt are left out, so only profiles
+    that no earlier run (with any query) scraped are given back. Callers mark the
+    profiles as seen once they've scraped them
 
     :param driver: the selenium webdriver instance
     :param job_query: a list of strings containing the types of jobs to look for
@@ -97,37 +393,36 @@ def get_user_profiles(
         will scrape as many pages as quickly as possible and rely on a human to do the
         bot detection test
     :param num_pages: how many pages of Google search results to scrape
-    :return:
+    :param cache_ttl: seconds a cached page of search results is reused for
+    :return: the normalized URLs of the profiles that haven't been seen before
     """
-    # look for profiles related to the job type
-    driver.get("https://www.google.com")
-
-    # wait for search box to become interactable
-    try:
-        WebDriverWait(driver, 10).until(
-            EC.visibility_of_all_elements_located((By.NAME, "q"))
-        )
-    except TimeoutException:
-        pass
-
     # quote the specific terms we want to find related to our job and find relevant profiles on Google
-    quoted_query = [f"\"{search_term}\"" for search_term in job_query]
+    quoted_query = [f'"{search_term}"' for search_term in normalize_query(job_query)]
     search_query = " AND ".join(["site:linkedin.com/in/"] + quoted_query)
 
     print(f"Looking for jobs on LinkedIn with the query {search_query}")
 
-    search_box = driver.find_element(By.NAME, "q")
-    search_box.send_keys(search_query)
-    search_box.send_keys(Keys.ENTER)
+    serp_cache = SerpCache(ENV_RESOURCES + "serp_cache.json", cache_ttl)
+    seen_profiles = SeenProfiles(SEEN_PROFILES_PATH)
 
     # get the LinkedIn URLs for each profile on each Google search result page
     all_profile_urls = []
+    pages_searched = 0
     for page in range(num_pages):
-        try:
+        page_profile_urls = serp_cache.get(search_query, page)
+        if page_profile_urls is None:
             # Google advanced searches are rate limited
-            if full_automation and page % 5 == 0:
+            if full_automation and pages_searched and pages_searched % 5 == 0:
                 time.sleep(7200)
 
+            # go straight to the page of results, so cached pages don't have to be
+            # clicked through
+            driver.get(
+                f"https://www.google.com/search?q={quote_plus(search_query)}"
+                f"&start={page * 10}"
+            )
+            pages_searched += 1
+
             # manually handle bot detection
             while re.search(r"google.com/sorry/", driver.current_url):
                 input(f"Google bot detection page. Waiting for user input...")
@@ -145,26 +440,34 @@ def get_user_profiles(
             linkedin_users_urls_list = driver.find_elements(
                 By.XPATH, '//div[@class="yuRUbf"]/a[@href]'
             )
-            [
-                all_profile_urls.append(profile.get_attribute("href"))
-                for profile in linkedin_users_urls_list
-                if re.search(
-                    r"linkedin.com", profile.get_attribute("href"), flags=re.IGNORECASE
-                )
+            page_profile_urls = [
+                profile.get_attribute("href") for profile in linkedin_users_urls_list
             ]
+            # an empty page is more likely a consent page or changed markup than the end
+            # of the results, so it's searched again next time instead of cached
+            if page_profile_urls:
+                serp_cache.put(search_query, page, page_profile_urls)
 
             time.sleep(random.choice(range(12)))
 
-            next_page_button = driver.find_element(By.ID, "pnnext")
-            next_page_button.click()
-
-        # save user profiles if bot detection can't be handled
-        except TimeoutException as error:
-            raise error
-
-        finally:
-            with open(ENV_RESOURCES + "user_profile_urls.txt", "a+") as outfile:
-                outfile.write("\n".join(all_profile_urls))
+        normalized_urls = [
+            normalize_profile_url(profile_url) for profile_url in page_profile_urls
+        ]
+        new_profile_urls = [
+            url
+            for url in seen_profiles.unseen([url for url in normalized_urls if url])
+            if url not in all_profile_urls
+        ]
+        all_profile_urls.extend(new_profile_urls)
+
+        # save user profiles as they're found in case bot detection can't be handled
+        with open(ENV_RESOURCES + "user_profile_urls.txt", "a+") as outfile:
+            outfile.write("".join(f"{url}\n" for url in new_profile_urls))
+
+    print(
+        f"Found {len(all_profile_urls)} new profiles "
+        f"({pages_searched} of {num_pages} result pages searched, the rest cached)"
+    )
 
     return all_profile_urls
 
@@ -211,7 +514,25 @@ def scrape_skills(
         input(f"LinkedIn verification step detected. Waiting for human input...")
 
     # find the url to get to the skills page and navigate there
-    profile_selector = Selector(text=driver.page_source)
+    skills_page_url = find_skills_page_url(driver.page_source)
+
+    if skills_page_url:
+        driver.get(skills_page_url)
+    else:
+        raise IndexError("No skill card found")
+
+    # get the skills listed in the profile
+    return parse_skills_page(driver.page_source)
+
+
+def find_skills_page_url(page_source: str) -> Optional[str]:
+    """
+    Find the link to the full skills page in a LinkedIn profile page
+
+    :param page_source: the HTML of the profile page
+    :return: the skills page URL, or None if the profile has no skill card
+    """
+    profile_selector = Selector(text=page_source)
     skills_url_pattern = re.compile(
         "(?<=href=\")https://[a-z]{2,3}\.linkedin\.com/.*/details/skills\?.*(?=\">)",
         flags=re.IGNORECASE,
@@ -220,16 +541,20 @@ def scrape_skills(
         "//div[@class='pvs-list__footer-wrapper']/div[@class]/a[@class][@href][@target]"
     ).re(skills_url_pattern)
 
-    if skills_page_url:
-        driver.get(skills_page_url[0])
-    else:
-        raise IndexError("No skill card found")
+    return skills_page_url[0] if skills_page_url else None
 
-    # get the skills listed in the profile
+
+def parse_skills_page(page_source: str) -> set[str]:
+    """
+    Get the skills listed on a LinkedIn skills page
+
+    :param page_source: the HTML of the details/skills page
+    :return:
+    """
     skills_text_pattern = re.compile(
         fr"(?<=<span aria-hidden=\"true\"><!---->).*(?=<!----></span>)"
     )
-    skills_selector = Selector(text=driver.page_source)
+    skills_selector = Selector(text=page_source)
     skills_list = skills_selector.xpath(
         "//span[@class='mr1 hoverable-link-text t-bold']/span[@aria-hidden='true']"
     ).re(skills_text_pattern)
@@ -237,6 +562,135 @@ def scrape_skills(
     return set(skills_list)
 
 
+def http_session(
+    cookies: list[dict], user_agent: str, pool_size: int = 8
+) -> requests.Session:
+    """
+    Make an HTTP session that carries a logged in browser's cookies, so pages behind the
+    LinkedIn login can be fetched without driving the browser
+
+    :param cookies: the browser's cookies, as returned by driver.get_cookies()
+    :param user_agent: the browser's user agent. LinkedIn ties the session to it
+    :param pool_size: number of connections kept open per host
+    :return:
+    """
+    session = requests.Session()
+    session.headers.update(
+        {
+            "User-Agent": user_agent,
+            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+            "Accept-Language": "en-US,en;q=0.9",
+        }
+    )
+    for cookie in cookies:
+        session.cookies.set(
+            cookie["name"],
+            cookie["value"],
+            domain=cookie.get("domain", ""),
+            path=cookie.get("path", "/"),
+        )
+
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=pool_size, pool_maxsize=pool_size
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    return session
+
+
+def http_session_from_driver(
+    driver: selenium.webdriver.chrome.webdriver.WebDriver, pool_size: int = 8
+) -> requests.Session:
+    """
+    Hand a logged in selenium webdriver's session over to an HTTP session
+
+    :param driver: the selenium webdriver instance, after linkedin_login
+    :param pool_size: number of connections kept open per host
+    :return:
+    """
+    return http_session(
+        driver.get_cookies(),
+        driver.execute_script("return navigator.userAgent"),
+        pool_size,
+    )
+
+
+def fetch_skills(
+    session: requests.Session, profile_url: str, timeout: float = 30.0
+) -> set[str]:
+    """
+    Get the skills from a particular LinkedIn profile over HTTP
+
+    :param session: an HTTP session with LinkedIn login cookies
+    :param profile_url: a scraped LinkedIn profile URL
+    :param timeout: seconds to wait for each page
+    :return:
+    """
+    formatted_profile_url = profile_url.strip().removesuffix("/")
+    response = session.get(formatted_profile_url, timeout=timeout)
+    response.raise_for_status()
+    if re.search(r"/authwall|/login|/checkpoint/", response.url):
+        raise PermissionError(
+            f"LinkedIn session expired fetching {formatted_profile_url}"
+        )
+
+    # the skill card link is only in the page when LinkedIn renders it server side. the
+    # skills page of a profile is always at the same place, so fall back to that
+    skills_page_url = find_skills_page_url(response.text) or urljoin(
+        response.url.removesuffix("/") + "/", "details/skills/"
+    )
+
+    response = session.get(skills_page_url, timeout=timeout)
+    response.raise_for_status()
+
+    return parse_skills_page(response.text)
+
+
+async def fetch_all_skills(
+    session: requests.Session,
+    profile_urls: list[str],
+    concurrency: int = 8,
+    on_scraped=None,
+) -> dict:
+    """
+    Fetch the skills of many LinkedIn profiles concurrently over one pooled HTTP session
+
+    :param session: an HTTP session with LinkedIn login cookies
+    :param profile_urls: scraped LinkedIn profile URLs
+    :param concurrency: maximum number of profiles fetched at once
+    :param on_scraped: called with (profile_url, skills) as each profile finishes, e.g. to
+        save the skills as they come in
+    :return: the skills of each profile that could be fetched, keyed by profile URL
+    """
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    async def fetch(profile_url):
+        try:
+            return profile_url, await loop.run_in_executor(
+                executor, fetch_skills, session, profile_url
+            )
+        except (requests.RequestException, IndexError, PermissionError) as error:
+            print(f"Could not fetch skills for {profile_url.strip()}: {error}")
+            return profile_url, None
+
+    all_skills = {}
+    try:
+        for fetched in asyncio.as_completed([fetch(url) for url in profile_urls]):
+            profile_url, skills = await fetched
+            if skills is None:
+                continue
+            all_skills[profile_url] = skills
+            if on_scraped:
+                on_scraped(profile_url, skills)
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+    return all_skills
+
+
+@profiling.profiled
 def main(
     num_pages: int = typer.Argument(
         5, help="number of Google pagination actions to attempt"
@@ -259,6 +713,42 @@ def main(
             "prepend each term with a --job_query flag"
         ),
     ),
+    browser_profile: str = typer.Option(
+        "default",
+        help="'default' (a full Chrome window) or 'lean' (headless, no images, media or trackers)",
+    ),
+    chrome_profile_dir: str = typer.Option(
+        "",
+        help=(
+            "Chrome user data directory to reuse so LinkedIn stays logged in between runs. it "
+            "holds the LinkedIn session cookies, so keep it out of version control"
+        ),
+    ),
+    fetch_mode: str = typer.Option(
+        "browser",
+        help=(
+            "'browser' visits every profile in Chrome, 'http' only uses Chrome to log in and "
+            "fetches the profiles over HTTP with the browser's cookies"
+        ),
+    ),
+    concurrency: int = typer.Option(
+        8, help="number of profiles fetched at once in the http fetch mode"
+    ),
+    serp_cache_hours: float = typer.Option(
+        168, help="hours a cached page of Google search results is reused for"
+    ),
+    profile: bool = typer.Option(
+        False,
+        "--profile",
+        help="profile the run and write a flamegraph compatible profile and a hot function summary",
+    ),
+    profile_output: str = typer.Option(
+        "profile", help="path prefix of the profile output files"
+    ),
+    profile_mode: str = typer.Option(
+        "sampling",
+        help="'sampling' (low overhead, broken down by pipeline stage) or 'deterministic' (cProfile)",
+    ),
 ):
 
     if not job_query and not restart:
@@ -266,20 +756,32 @@ def main(
             "At least one job query term needs to be provided if starting from scratch"
         )
 
+    if fetch_mode not in FETCH_MODES:
+        raise typer.BadParameter(
+            f"Unknown fetch mode {fetch_mode!r}, expected one of {', '.join(FETCH_MODES)}",
+            param_hint="--fetch_mode",
+        )
+
     if not credentials:
         credentials = "credentials.json"
 
-    driver = initialize_web_scraper()
+    driver = initialize_web_scraper(
+        profile_dir=chrome_profile_dir, **browser_profile_options(browser_profile)
+    )
     try:
         with open(credentials, "r") as infile:
             credentials = json.load(infile)
     except FileNotFoundError:
         raise FileNotFoundError("Could not find a credentials file containing LinkedIn")
 
-    linkedin_login(driver, credentials)
+    with instrumentation.stage("linkedin_login"):
+        linkedin_login(driver, credentials)
 
     if not restart:
-        user_profiles = get_user_profiles(driver, job_query, full_automation, num_pages)
+        with instrumentation.stage("profile_search"):
+            user_profiles = get_user_profiles(
+                driver, job_query, full_automation, num_pages, serp_cache_hours * 3600
+            )
         all_relevant_skills = set()
     else:
         try:
@@ -298,30 +800,57 @@ def main(
 
     # keep track of the profiles that have already been scraped
     scraped_profiles = []
+    seen_profiles = SeenProfiles(SEEN_PROFILES_PATH)
+
+    def record_skills(user_profile, scraped_skills):
+        nonlocal all_relevant_skills
+
+        # only keep track of skills that haven't been seen before
+        new_skills = scraped_skills - all_relevant_skills
+
+        # dump scraped skills after every profile in case of exception
+        with open(ENV_RESOURCES + "scraped_skills.txt", "a+") as outfile:
+            outfile.write("\n".join(new_skills))
+            if new_skills:
+                outfile.write("\n")
+        all_relevant_skills = all_relevant_skills.union(scraped_skills)
+        scraped_profiles.append(user_profile)
+        seen_profiles.add([normalize_profile_url(user_profile.strip())])
+
+    def save_skipped_profiles():
+        # dump profiles that haven't been scraped yet to reduce next restart's runtime in case of error
+        skipped_profiles = list(set(user_profiles) - set(scraped_profiles))
+        with open(ENV_RESOURCES + "user_profiles.txt", "w") as outfile:
+            outfile.write(
+                "".join(f"{profile.strip()}\n" for profile in skipped_profiles)
+            )
 
-    for user_profile in user_profiles:
+    if fetch_mode == "http":
+        session = http_session_from_driver(driver, pool_size=concurrency)
+        driver.quit()
         try:
-            with open(ENV_RESOURCES + "scraped_skills.txt", "a+") as outfile:
-                time.sleep(random.choice(range(10)))
-                scraped_skills = scrape_skills(driver, user_profile)
+            with instrumentation.stage("skill_scrape", fetch_mode="http"):
+                asyncio.run(
+                    fetch_all_skills(
+                        session, user_profiles, concurrency, on_scraped=record_skills
+                    )
+                )
+        finally:
+            save_skipped_profiles()
 
-                # only keep track of skills that haven't been seen before
-                new_skills = scraped_skills - all_relevant_skills
+        return
 
-                # dump scraped skills after every profile in case of exception
-                outfile.write("\n".join(new_skills))
-                if new_skills:
-                    outfile.write("\n")
-                all_relevant_skills = all_relevant_skills.union(scraped_skills)
-                scraped_profiles.append(user_profile)
+    for user_profile in user_profiles:
+        try:
+            time.sleep(random.choice(range(10)))
+            with instrumentation.stage("skill_scrape"):
+                scraped_skills = scrape_skills(driver, user_profile)
+            record_skills(user_profile, scraped_skills)
 
         except IndexError:
             continue
 
         finally:
-            # dump profiles that haven't been scraped yet to reduce next restart's runtime in case of error
-            skipped_profiles = list(set(user_profiles) - set(scraped_profiles))
-            with open(ENV_RESOURCES + "user_profiles.txt", "w") as outfile:
-                outfile.write("".join(skipped_profiles))
+            save_skipped_profiles()
 
     return
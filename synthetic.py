@@ -0,0 +1,37 @@
+import random
+
+import model
+
+ENV_RESOURCES = "resources/"
+
+RESUME_SECTIONS = ["Experience", "Education", "Projects", "Skills", "Publications"]
+
+
+def synthetic_resume(
+    rng: random.Random, skill_list: list, sentence_templates: model.SentenceTemplate
+) -> str:
+    """
+    make up a resume with a name, a few sections of templated sentences and a bulleted
+    skills list, so the benchmarks don't depend on any real resume
+
+    :param rng: the random number generator to use
+    :param skill_list: the list of skills to draw from
+    :param sentence_templates: templates used to write the sentences of each section
+    :return: the resume text
+    """
+    lines = ["Jane Doe", "jane.doe@example.com", ""]
+    for section in RESUME_SECTIONS:
+        lines.append(section)
+        if section == "Skills":
+            lines.extend(f"• {skill}" for skill in rng.sample(skill_list, k=12))
+        else:
+            section_skills = rng.sample(skill_list, k=15)
+            lines.extend(
+                sentence
+                for sentence, _ in sentence_templates.generate(
+                    section_skills, seed=rng.getrandbits(32)
+                )
+            )
+        lines.append("")
+
+    return "\n".join(lines)
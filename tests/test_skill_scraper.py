@@ -0,0 +1,97 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("parsel")
+pytest.importorskip("selenium")
+requests = pytest.importorskip("requests")
+
+import skill_scraper
+
+PROFILE_PAGE = "<html><body><h1>{name}</h1></body></html>"
+
+SKILLS_PAGE = "<html><body>{skills}</body></html>"
+
+SKILL_SPAN = (
+    '<span class="mr1 hoverable-link-text t-bold">'
+    '<span aria-hidden="true"><!---->{skill}<!----></span></span>'
+)
+
+PROFILE_SKILLS = {
+    "alice": ["Python", "SQL"],
+    "bob": ["Kubernetes"],
+}
+
+
+class LinkedInHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        parts = self.path.strip("/").split("/")
+        if parts[:2] == ["in", "blocked"]:
+            self.send_response(302)
+            self.send_header("Location", "/authwall")
+            self.end_headers()
+            return
+
+        if parts[0] == "in" and parts[1] in PROFILE_SKILLS:
+            if parts[2:] == ["details", "skills"]:
+                page = SKILLS_PAGE.format(
+                    skills="".join(
+                        SKILL_SPAN.format(skill=skill)
+                        for skill in PROFILE_SKILLS[parts[1]]
+                    )
+                )
+            else:
+                page = PROFILE_PAGE.format(name=parts[1])
+        elif parts == ["authwall"]:
+            page = PROFILE_PAGE.format(name="sign in")
+        else:
+            self.send_error(404)
+            return
+
+        body = page.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def linkedin_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), LinkedInHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_fetch_all_skills(linkedin_url):
+    profile_urls = [
+        f"{linkedin_url}/in/alice/\n",
+        f"{linkedin_url}/in/bob",
+        f"{linkedin_url}/in/blocked",
+        f"{linkedin_url}/in/missing",
+    ]
+    scraped = []
+
+    all_skills = asyncio.run(
+        skill_scraper.fetch_all_skills(
+            requests.Session(),
+            profile_urls,
+            concurrency=2,
+            on_scraped=lambda url, skills: scraped.append(url),
+        )
+    )
+
+    # the blocked profile hits the authwall and the missing one 404s, both are skipped
+    assert all_skills == {
+        profile_urls[0]: {"Python", "SQL"},
+        profile_urls[1]: {"Kubernetes"},
+    }
+    assert sorted(scraped) == sorted(all_skills)
@@ -0,0 +1,162 @@
+import gc
+import multiprocessing
+import os
+
+import numpy
+
+import extraction
+import model
+
+# the pipeline used by the worker processes. set in the parent before forking so every worker
+# shares the parent's copy of the weights and vectors instead of loading its own
+_worker_nlp = None
+
+
+def mmap_vectors(nlp: model.NLP, vectors_path: str):
+    """
+    swap the pipeline's in-memory vector table for a read-only memory map of the same table
+    on disk. the pages are then backed by the OS page cache and shared by every process that
+    maps the file, and the in-memory table can be freed
+
+    :param nlp: the NLP wrapper whose vectors should be memory mapped
+    :param vectors_path: .npy file to map. written from the current vectors if it doesn't exist
+    :return:
+    """
+    vectors = nlp.nlp.vocab.vectors
+    if not os.path.isfile(vectors_path):
+        numpy.save(vectors_path, vectors.data)
+
+    vectors.data = numpy.load(vectors_path, mmap_mode="r")
+
+
+def load_worker_nlp(model_path: str, vectors_path: str = None):
+    global _worker_nlp
+
+    _worker_nlp = model.NLP(model_path)
+    if vectors_path:
+        mmap_vectors(_worker_nlp, vectors_path)
+
+
+def init_worker(pid_queue, model_path: str = None, vectors_path: str = None):
+    """
+    pool initializer. reports the worker's pid back to the parent, and loads the model
+    unless the worker was forked with it already loaded
+
+    :param pid_queue: queue the worker's pid is put on
+    :param model_path: the model to load. None if it was loaded before forking
+    :param vectors_path: if given, memory map the vector table from this .npy file
+    :return:
+    """
+    pid_queue.put(os.getpid())
+    if model_path:
+        load_worker_nlp(model_path, vectors_path)
+
+
+def extract_worker(text: str) -> list:
+    with _worker_nlp.nlp.select_pipes(enable=_worker_nlp.serving_components()):
+        return extraction.extract_entities(_worker_nlp.nlp, text)
+
+
+def process_memory(pid: int) -> dict:
+    """
+    the memory of a process broken down into pages it shares with other processes and
+    pages only it uses. only available on Linux
+
+    :param pid: the process id
+    :return: rss, shared and private memory in bytes
+    """
+    memory = {"rss": 0, "shared": 0, "private": 0}
+    with open(f"/proc/{pid}/smaps_rollup", "r") as infile:
+        for line in infile:
+            field, _, value = line.partition(":")
+            if not value.strip().endswith("kB"):
+                continue
+            size = int(value.split()[0]) * 1024
+            if field == "Rss":
+                memory["rss"] += size
+            elif field.startswith("Shared_"):
+                memory["shared"] += size
+            elif field.startswith("Private_"):
+                memory["private"] += size
+
+    return memory
+
+
+class ExtractionWorkerPool:
+    """
+    a pool of worker processes that extract entities from resumes with one shared copy of
+    the model. with the fork start method the model is loaded once in the parent and the
+    workers share its memory copy-on-write; otherwise each worker loads the model itself and
+    only the memory mapped vectors are shared
+    """
+
+    def __init__(
+        self,
+        model_path: str,
+        num_workers: int = None,
+        vectors_path: str = None,
+        start_method: str = "fork",
+    ):
+        """
+        :param model_path: anything accepted by model.NLP, usually a saved serving pipeline
+        :param num_workers: number of worker processes. defaults to the number of CPUs
+        :param vectors_path: if given, memory map the vector table from this .npy file
+        :param start_method: multiprocessing start method. fork shares the whole model
+        """
+        context = multiprocessing.get_context(start_method)
+        self.__num_workers = num_workers or multiprocessing.cpu_count()
+        self.__pid_queue = context.SimpleQueue()
+        self.__pids = []
+
+        if start_method == "fork":
+            load_worker_nlp(model_path, vectors_path)
+            # move everything allocated so far out of the garbage collector's reach so
+            # collections in the workers don't write to (and so copy) the shared pages
+            gc.freeze()
+            self.__pool = context.Pool(
+                self.__num_workers,
+                initializer=init_worker,
+                initargs=(self.__pid_queue,),
+            )
+        else:
+            self.__pool = context.Pool(
+                self.__num_workers,
+                initializer=init_worker,
+                initargs=(self.__pid_queue, model_path, vectors_path),
+            )
+
+    def extract(self, texts: list, chunksize: int = 1) -> list:
+        """
+        :param texts: the resumes to extract entities from
+        :param chunksize: number of resumes sent to a worker at a time
+        :return: the entities of each resume, in the same order as texts
+        """
+        return self.__pool.map(extract_worker, texts, chunksize=chunksize)
+
+    @property
+    def pids(self) -> list:
+        """
+        :return: the pids the workers reported from the pool initializer. waits for workers
+            that haven't started yet
+        """
+        while len(self.__pids) < self.__num_workers:
+            self.__pids.append(self.__pid_queue.get())
+
+        return list(self.__pids)
+
+    def memory_usage(self) -> dict:
+        """
+        :return: the shared and private memory of each worker process, keyed by pid
+        """
+        return {pid: process_memory(pid) for pid in self.pids}
+
+    def close(self):
+        self.__pool.close()
+        self.__pool.join()
+        gc.unfreeze()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()